@@ -0,0 +1,236 @@
+"""预构建的资源包：把缩放好的谱号图片和预先合成的全部音符 PCM 打包成一个带版本号的文件，启动时直接内存映射。
+
+文件格式：
+    魔数 b'MNGPACK1' | 头部长度 (uint32) | 头部 JSON | 数据块 ...（每块按 64 字节对齐）
+头部记录格式版本、合成参数指纹，以及每个数据块的偏移、长度和形状。图片为 BGRA 像素（与 convert_alpha 的
+格式相同），声音为 int16 PCM。读取时用 mmap 映射整个文件，图片切片直接交给 pygame.image.frombuffer（零拷贝），
+声音切片用 np.frombuffer 得到数组视图后交给 pygame.sndarray（由 pygame 复制一次进混音器）。
+
+合成参数、采样率/声道数或源图片有变化时，对应条目视为过期，游戏回退到运行时生成。
+
+    python asset_pack.py build                 # 生成 assets/assets.mngpack
+    python asset_pack.py startup               # 比较有/无资源包时的冷启动耗时（JSON）
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+import tone_synth
+
+PACK_MAGIC = b'MNGPACK1'
+PACK_VERSION = 1
+HEADER_LENGTH = struct.Struct('<I')
+ALIGN = 64
+PACK_NAME = 'assets.mngpack'
+
+def synth_fingerprint(duration):
+    """合成参数的指纹：音色、ADSR 或时长改变后，包里的 PCM 就过期了"""
+    params = {
+        'timbres': tone_synth.TIMBRES,
+        'adsr': [tone_synth.ATTACK_TIME, tone_synth.DECAY_TIME, tone_synth.SUSTAIN_LEVEL, tone_synth.RELEASE_TIME],
+        'duration': duration,
+    }
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+def image_key(name, height, transform):
+    return f"{name}|{height}|{transform}"
+
+def sound_key(timbre, note):
+    return f"{timbre}/{note}"
+
+def data_start(header_length):
+    """数据区从头部之后的第一个对齐位置开始；各块的 offset 都相对于数据区"""
+    prefix = len(PACK_MAGIC) + HEADER_LENGTH.size + header_length
+    return -(-prefix // ALIGN) * ALIGN
+
+def write_pack(path, header, blobs):
+    """blobs: {'images' 或 'sounds': {键: (元数据字典, bytes)}}；先写临时文件再替换"""
+    header = dict(header, version=PACK_VERSION, images={}, sounds={})
+    layout, offset = [], 0
+    for section in ('images', 'sounds'):
+        for key, (meta, data) in blobs.get(section, {}).items():
+            header[section][key] = dict(meta, offset=offset, nbytes=len(data))
+            layout.append(data)
+            offset += -(-len(data) // ALIGN) * ALIGN
+    payload = json.dumps(header).encode('utf-8')
+    prefix = len(PACK_MAGIC) + HEADER_LENGTH.size + len(payload)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PACK_MAGIC + HEADER_LENGTH.pack(len(payload)) + payload)
+        f.write(b'\0' * (data_start(len(payload)) - prefix))
+        for data in layout:
+            f.write(data)
+            f.write(b'\0' * (-len(data) % ALIGN))
+    os.replace(tmp_path, path)
+
+class AssetPack:
+    """只读的内存映射资源包；返回的数组和缓冲区都引用映射本身，包对象需要一直保留"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空文件无法映射
+            self._file.close()
+            raise
+        if self._map[:len(PACK_MAGIC)] != PACK_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not an asset pack")
+        (length,) = HEADER_LENGTH.unpack_from(self._map, len(PACK_MAGIC))
+        start = len(PACK_MAGIC) + HEADER_LENGTH.size
+        self.header = json.loads(self._map[start:start + length].decode('utf-8'))
+        self._base = data_start(length)
+        self._view = memoryview(self._map)
+
+    @classmethod
+    def open(cls, path):
+        """打开资源包；文件不存在、损坏或格式版本不符时返回 None"""
+        try:
+            pack = cls(path)
+        except (OSError, ValueError):
+            return None
+        if pack.header.get('version') != PACK_VERSION:
+            pack.close()
+            return None
+        return pack
+
+    def image(self, name, height, transform, digest=None):
+        """返回 (像素缓冲区, (宽, 高))；没有该条目或源图片已改变（digest 不符）时返回 None"""
+        entry = self.header['images'].get(image_key(name, height, transform))
+        if entry is None or (digest is not None and entry['digest'] != digest):
+            return None
+        start = self._base + entry['offset']
+        return self._view[start:start + entry['nbytes']], tuple(entry['size'])
+
+    def sound(self, timbre, note, sample_rate, channels, duration):
+        """返回 int16 PCM 的只读数组视图；参数与打包时不同（过期）时返回 None"""
+        header = self.header
+        if (header['sample_rate'], header['channels']) != (sample_rate, channels) \
+                or header['synth'] != synth_fingerprint(duration):
+            return None
+        entry = header['sounds'].get(sound_key(timbre, note))
+        if entry is None:
+            return None
+        wave = np.frombuffer(self._map, dtype='<i2', count=entry['nbytes'] // 2,
+                             offset=self._base + entry['offset'])
+        return wave.reshape(entry['shape'])
+
+    def close(self):
+        # 仍被 Surface/数组引用时映射不能关闭，交给垃圾回收
+        self._view = None
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+# --- 构建 ---
+def build(path, sample_rate=22050, channels=1, timbres=('piano',)):
+    """用游戏自己的加载/合成流程生成资源包，保证与运行时生成的结果完全一致；返回条目数"""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    import pygame
+    import music_note_game as game
+    pygame.display.init()
+    game.set_display_mode((1, 1))
+    images = {}
+    cache = game.AssetCache(disk_dir=None)
+    for name, height, transform in game.pack_images():
+        source = game.asset_path(name)
+        surface = cache.image(source, height, transform)
+        if surface is None:
+            continue
+        images[image_key(name, height, transform)] = (
+            {'size': list(surface.get_size()), 'format': 'BGRA', 'digest': game.file_digest(source)},
+            pygame.image.tobytes(surface, 'BGRA'))
+    pygame.display.quit()
+    duration = game.SOUND_BANK.duration
+    notes = list(dict.fromkeys(list(tone_synth.NOTE_FREQUENCIES)
+                               + [note for clef in game.CLEFS.values() for note in clef.note_names]))
+    sounds = {}
+    for timbre in timbres:
+        waves = tone_synth.synthesize_tones([tone_synth.note_frequency(note) for note in notes], duration,
+                                            sample_rate, tone_synth.TIMBRES[timbre], channels)
+        for note, wave in zip(notes, waves):
+            wave = np.ascontiguousarray(wave, dtype='<i2')
+            sounds[sound_key(timbre, note)] = ({'shape': list(wave.shape)}, wave.tobytes())
+    header = {'sample_rate': sample_rate, 'channels': channels, 'synth': synth_fingerprint(duration)}
+    write_pack(path, header, {'images': images, 'sounds': sounds})
+    return len(images) + len(sounds)
+
+# --- 冷启动对比 ---
+# 在全新的用户目录中启动子进程：初始化、画出菜单、加载各谱号图片并取得全部音符的声音
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import music_note_game as game
+imported = time.perf_counter()
+game.init(headless=True, use_pack=sys.argv[1] == 'pack')
+initialized = time.perf_counter()
+game.draw_menu()
+for clef in game.CLEFS.values():
+    if clef.image:
+        game.ASSET_CACHE.image(game.asset_path(clef.image), height=game.STAFF_CLEF_HEIGHT, transform='ink')
+    for note in clef.note_names:
+        game.SOUND_BANK.get(note)
+done = time.perf_counter()
+print(json.dumps({'total_s': done - start, 'import_s': imported - start, 'init_s': initialized - imported,
+                  'assets_s': done - initialized, 'pack': game.ASSET_PACK is not None}))
+"""
+
+def measure_startup(use_pack, repeat=3):
+    """各阶段耗时（秒），取多次冷启动中总耗时最短的一次"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as home:
+            env = dict(os.environ, HOME=home, USERPROFILE=home, PYGAME_HIDE_SUPPORT_PROMPT='1')
+            output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, 'pack' if use_pack else 'none'],
+                                    cwd=here, env=env, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if use_pack and not result['pack']:
+            raise RuntimeError("asset pack was not loaded; run 'python asset_pack.py build' first")
+        if best is None or result['total_s'] < best['total_s']:
+            best = result
+    del best['pack']
+    return best
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help="bake clef images and note PCM into the pack")
+    build_parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                'assets', PACK_NAME))
+    build_parser.add_argument('--sample-rate', type=int, default=22050,
+                              help="must match the game's --sample-rate for the PCM to be used")
+    build_parser.add_argument('--channels', type=int, choices=[1, 2], default=1,
+                              help="must match the game's --audio-channels")
+    build_parser.add_argument('--timbre', action='append', choices=sorted(tone_synth.TIMBRES),
+                              help="timbres to bake (repeatable, default: piano)")
+    startup_parser = commands.add_parser('startup', help="compare cold start time with and without the pack")
+    startup_parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        count = build(args.output, args.sample_rate, args.channels, tuple(args.timbre or ('piano',)))
+        print(f"wrote {count} entries to {args.output} ({os.path.getsize(args.output) / 1024:.0f} KB)")
+    else:
+        without = measure_startup(False, args.repeat)
+        with_pack = measure_startup(True, args.repeat)
+        print(json.dumps({'without_pack': without, 'with_pack': with_pack,
+                          'assets_speedup': without['assets_s'] / with_pack['assets_s'],
+                          'total_speedup': without['total_s'] / with_pack['total_s']}, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""帧时间基准：在 headless 模式下用脚本化的输入事件驱动 menu_loop、各谱号的练习循环 run_clef 和视奏模式。
+
+每个场景运行固定帧数，统计每帧耗时（不含 clock.tick 的等待时间）的 p50/p95/p99，
+另外报告启动时间和峰值内存，结果以 JSON 输出，便于在 CI 上做性能回归比较。
+视奏场景把音符间距压得很密，让同屏音符超过 200 个，并报告实际的最大同屏音符数：
+
+    python benchmark.py --frames 600 --output bench.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+# pygame 的欢迎信息会混进 JSON 输出
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+class ScriptedClock:
+    """替换游戏的 clock：记录每帧耗时，按脚本注入输入事件，跑满帧数后发送 QUIT"""
+
+    def __init__(self, pygame, frames, script, throttle=False, fps=60):
+        self.pygame = pygame
+        self.frames = frames
+        self.script = script          # fn(frame_index) -> 事件列表
+        self.throttle = throttle
+        self.fps = fps                # 限速时空闲帧（游戏传入 0）按此帧率推进脚本
+        self.clock = pygame.time.Clock()
+        self.frame_times = []
+        # 空闲时游戏阻塞在 pygame.event.wait 上；每帧投递一个无意义的自定义事件把它唤醒
+        self.wake = pygame.event.custom_type()
+        self._last = time.perf_counter()
+
+    def tick(self, framerate=0):
+        now = time.perf_counter()
+        self.frame_times.append(now - self._last)
+        frame = len(self.frame_times)
+        if frame >= self.frames:
+            self.pygame.event.post(self.pygame.event.Event(self.pygame.QUIT))
+        else:
+            for event in self.script(frame):
+                self.pygame.event.post(event)
+            self.pygame.event.post(self.pygame.event.Event(self.wake))
+        if self.throttle:
+            self.clock.tick(framerate or self.fps)
+        self._last = time.perf_counter()
+        return 0
+
+    def get_fps(self):
+        return self.clock.get_fps()
+
+def menu_script(pygame, rng):
+    def script(frame):
+        # 鼠标在两个谱号按钮之间来回移动，触发悬停高亮
+        x = rng.randint(0, 900)
+        y = rng.choice([250, 350, 500])
+        return [pygame.event.Event(pygame.MOUSEMOTION, pos=(x, y), rel=(0, 0), buttons=(0, 0, 0))]
+    return script
+
+def answer_script(pygame, rng, every=10):
+    def script(frame):
+        if frame % every:
+            return []
+        key = pygame.K_SPACE if rng.random() < 0.1 else rng.randint(pygame.K_1, pygame.K_7)
+        return [pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode='', scancode=0)]
+    return script
+
+# 视奏场景的音符基本间距（像素）：高音谱号 600 像素宽的五线谱上约 250 个音符
+SIGHT_SPACING = 2
+
+def summarize(frame_times):
+    ms = sorted(t * 1000 for t in frame_times)
+    return {
+        'frames': len(ms),
+        'mean_ms': sum(ms) / len(ms) if ms else 0.0,
+        'p50_ms': percentile(ms, 50),
+        'p95_ms': percentile(ms, 95),
+        'p99_ms': percentile(ms, 99),
+        'max_ms': ms[-1] if ms else 0.0,
+    }
+
+def run(frames=600, seed=0, throttle=False, scenarios=('menu', 'treble', 'bass', 'sight')):
+    tracemalloc.start()
+    start = time.perf_counter()
+    import music_note_game as game
+    import_time = time.perf_counter() - start
+    game.init(headless=True)
+    startup_time = time.perf_counter() - start
+
+    import pygame
+    rng = random.Random(seed)
+    random.seed(seed)
+    loops = {
+        'menu': (game.menu_loop, menu_script(pygame, rng)),
+        'treble': (lambda: game.run_clef(game.CLEFS['treble']), answer_script(pygame, rng)),
+        'bass': (lambda: game.run_clef(game.CLEFS['bass']), answer_script(pygame, rng)),
+        # 第一个音符从判定线开始排，第一帧起五线谱上就排满了音符
+        'sight': (lambda: game.run_sight_reading(game.CLEFS['treble'], spacing=SIGHT_SPACING,
+                                                 start=game.SIGHT_HIT_OFFSET),
+                  answer_script(pygame, rng, every=2)),
+    }
+    results = {}
+    for name in scenarios:
+        loop, script = loops[name]
+        pygame.event.clear()
+        game.clock = ScriptedClock(pygame, frames, script, throttle)
+        outcome = loop()
+        results[name] = summarize(game.clock.frame_times)
+        if name == 'sight':
+            results[name]['max_notes_in_view'] = outcome.max_visible
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pygame.quit()
+
+    report = {
+        'python': sys.version.split()[0],
+        'pygame': pygame.version.ver,
+        'frames_per_scenario': frames,
+        'throttled': throttle,
+        'import_time_s': import_time,
+        'startup_time_s': startup_time,
+        'peak_traced_memory_bytes': peak,
+        'scenarios': results,
+        'text_cache': game.TEXT_CACHE.stats(),
+    }
+    if resource is not None:
+        # Linux 上 ru_maxrss 以 KB 为单位
+        report['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=600, help="frames per scenario")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--throttle', action='store_true',
+                        help="keep the game's clock.tick frame cap instead of running flat out")
+    parser.add_argument('--scenario', action='append', choices=['menu', 'treble', 'bass', 'sight'],
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+    report = run(args.frames, args.seed, args.throttle, tuple(args.scenario or ('menu', 'treble', 'bass', 'sight')))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,22 @@
 import pygame
 import sys
+import argparse
 import random
 import os
 import math
+import hashlib
+import queue
+import threading
+import time
 import pathlib
 import numpy as np
+from collections import OrderedDict, deque, namedtuple
+import session_log
+from asset_pack import PACK_NAME, AssetPack
+from note_scheduler import NoteScheduler, NoteStats, load_schedulers, save_schedulers
+from pitch_detect import PitchStream, PitchWorker
+from quiz_session import CLEF_RANGES, NOTE_LETTERS, NotePool, QuizSession, SightReadingSession, diatonic_step
+from tone_synth import TIMBRES, note_frequency, render_sequence, synthesize_tone, synthesize_tones
 
 # --- 公共配置 ---
 WIDTH, HEIGHT = 900, 600
@@ -13,137 +25,477 @@ BLACK = (30, 30, 30)
 RED = (220, 60, 60)
 BLUE = (80, 120, 220)
 
-pygame.init()
-pygame.mixer.init(frequency=22050, size=-16, channels=1, buffer=512)
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Music Note Recognition Game")
-clock = pygame.time.Clock()
-
-# --- 音频生成函数 ---
-def generate_tone(frequency, duration=0.8, sample_rate=22050):
-    """生成模拟钢琴音色的音调"""
-    n_samples = int(duration * sample_rate)
-    t = np.linspace(0, duration, n_samples, False)
-    
-    # 钢琴音色由多个谐波组成（基频 + 泛音）
-    # 每个谐波的振幅不同，模拟真实钢琴的频谱
-    harmonics = [
-        (1.0, 1.0),      # 基频，最强
-        (2.0, 0.5),      # 第2谐波
-        (3.0, 0.25),     # 第3谐波
-        (4.0, 0.15),     # 第4谐波
-        (5.0, 0.1),      # 第5谐波
-        (6.0, 0.05),     # 第6谐波
-    ]
-    
-    # 叠加所有谐波
-    wave = np.zeros(n_samples)
-    for harmonic_ratio, amplitude in harmonics:
-        wave += amplitude * np.sin(frequency * harmonic_ratio * 2 * np.pi * t)
-    
-    # ADSR 包络（Attack-Decay-Sustain-Release）模拟钢琴击弦特性
-    attack_time = 0.005   # 5ms 快速起音
-    decay_time = 0.1      # 100ms 衰减
-    sustain_level = 0.6   # 持续音量 60%
-    release_time = 0.3    # 300ms 释放
-    
-    attack_samples = int(attack_time * sample_rate)
-    decay_samples = int(decay_time * sample_rate)
-    release_samples = int(release_time * sample_rate)
-    sustain_samples = n_samples - attack_samples - decay_samples - release_samples
-    
-    # 构建 ADSR 包络
-    envelope = np.zeros(n_samples)
-    
-    # Attack: 从 0 快速升到 1
-    envelope[:attack_samples] = np.linspace(0, 1, attack_samples)
-    
-    # Decay: 从 1 衰减到 sustain_level
-    envelope[attack_samples:attack_samples+decay_samples] = np.linspace(1, sustain_level, decay_samples)
-    
-    # Sustain: 保持在 sustain_level
-    envelope[attack_samples+decay_samples:attack_samples+decay_samples+sustain_samples] = sustain_level
-    
-    # Release: 从 sustain_level 衰减到 0
-    envelope[-release_samples:] = np.linspace(sustain_level, 0, release_samples)
-    
-    # 应用包络到波形
-    wave *= envelope
-    
-    # 归一化并转换为16位整数
-    wave = wave / np.max(np.abs(wave))  # 归一化到 -1 到 1
-    wave = (wave * 32767 * 0.5).astype(np.int16)  # 降低音量到 50%
-    
-    # 创建立体声（复制单声道）
-    stereo_wave = np.column_stack((wave, wave))
-    return pygame.sndarray.make_sound(stereo_wave)
-
-# 音符到频率的映射（A4 = 440Hz）
-NOTE_FREQUENCIES = {
-    'C4': 261.63, 'D4': 293.66, 'E4': 329.63, 'F4': 349.23,
-    'G4': 392.00, 'A4': 440.00, 'B4': 493.88,
-    'C5': 523.25, 'D5': 587.33, 'E5': 659.25, 'F5': 698.46,
-    'G5': 783.99, 'A5': 880.00,
-    # 低音谱号音符
-    'E2': 82.41, 'F2': 87.31, 'G2': 98.00, 'A2': 110.00, 'B2': 123.47,
-    'C3': 130.81, 'D3': 146.83, 'E3': 164.81,
-    'F3': 174.61, 'G3': 196.00, 'A3': 220.00, 'B3': 246.94
-}
+# 显示窗口和时钟由 init() 创建；导入本模块不会初始化 pygame
+screen = None
+clock = None
+
+# --- 音色库 ---
+# 音符在第一次被请求时才合成，结果放入受内存预算约束的 LRU 缓存；
+# prewarm 可在后台线程中提前合成接下来可能用到的音符。
+class SoundBank:
+    def __init__(self, budget_bytes=16 * 1024 * 1024, timbre='piano', duration=0.8, sample_rate=22050, channels=2):
+        self.budget_bytes = budget_bytes
+        self.timbre = timbre
+        self.duration = duration
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.used_bytes = 0
+        self._sounds = OrderedDict()   # (音符, 音色) -> (Sound, 字节数)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self.pack = None               # 预构建的资源包（见 asset_pack），有对应 PCM 时不再合成
+
+    def get(self, note, timbre=None):
+        key = (note, timbre or self.timbre)
+        with self._lock:
+            entry = self._sounds.get(key)
+            if entry is not None:
+                self._sounds.move_to_end(key)
+                return entry[0]
+        return self._synthesize(key)
+
+    def play(self, note, timbre=None):
+        """通过音频后端的反馈声道播放"""
+        if AUDIO.available:
+            AUDIO.play_feedback(self.get(note, timbre))
+
+    def configure(self, sample_rate, channels):
+        """按混音器的实际参数合成；参数变化时已缓存的声音全部作废"""
+        if (sample_rate, channels) != (self.sample_rate, self.channels):
+            self.sample_rate = sample_rate
+            self.channels = channels
+            self.clear()
+
+    def _packed(self, key):
+        if self.pack is None:
+            return None
+        return self.pack.sound(key[1], key[0], self.sample_rate, self.channels, self.duration)
+
+    def _synthesize(self, key):
+        note, timbre = key
+        wave = self._packed(key)
+        if wave is not None:
+            return self._store(key, wave)
+        wave = synthesize_tone(note_frequency(note), self.duration, self.sample_rate, TIMBRES[timbre],
+                               self.channels)
+        return self._store(key, wave)
+
+    def _store(self, key, wave):
+        sound = pygame.sndarray.make_sound(wave)
+        with self._lock:
+            # 后台线程可能已经抢先合成了同一个音符
+            if key in self._sounds:
+                return self._sounds[key][0]
+            self._sounds[key] = (sound, wave.nbytes)
+            self.used_bytes += wave.nbytes
+            while self.used_bytes > self.budget_bytes and len(self._sounds) > 1:
+                _, (_, nbytes) = self._sounds.popitem(last=False)
+                self.used_bytes -= nbytes
+        return sound
+
+    def prewarm(self, notes, timbre=None):
+        """在后台线程中预先合成给定音符"""
+        if not AUDIO.available:
+            return
+        timbre = timbre or self.timbre
+        with self._lock:
+            missing = [(note, timbre) for note in notes if (note, timbre) not in self._sounds]
+        for key in missing:
+            self._queue.put(key)
+        if missing and self._worker is None:
+            self._worker = threading.Thread(target=self._prewarm_worker, daemon=True)
+            self._worker.start()
+
+    def _prewarm_worker(self):
+        while True:
+            # 取出当前排队的全部音符，按音色分组批量合成
+            keys = [self._queue.get()]
+            while not self._queue.empty():
+                keys.append(self._queue.get_nowait())
+            with self._lock:
+                keys = [key for key in dict.fromkeys(keys) if key not in self._sounds]
+            # 资源包里有的直接取用，其余的再合成
+            packed = [(key, self._packed(key)) for key in keys]
+            for key, wave in packed:
+                if wave is not None:
+                    self._store(key, wave)
+            keys = [key for key, wave in packed if wave is None]
+            for timbre in {timbre for _, timbre in keys}:
+                group = [key for key in keys if key[1] == timbre]
+                waves = synthesize_tones([note_frequency(note) for note, _ in group],
+                                         self.duration, self.sample_rate, TIMBRES[timbre], self.channels)
+                for key, wave in zip(group, waves):
+                    self._store(key, wave)
+
+    def clear(self):
+        with self._lock:
+            self._sounds.clear()
+            self.used_bytes = 0
+
+SOUND_BANK = SoundBank()
+
+# --- 音频后端 ---
+# 混音器参数（采样率、缓冲区大小、声道数）可配置；音色库按混音器实际打开的参数合成，
+# 单声道时不再生成多余的立体声副本。反馈音走预留的声道池，不与其他声音抢声道。
+# 每次播放都记录“取到按键事件 -> 调用 play()”的延迟，供诊断界面显示。
+class AudioBackend:
+    def __init__(self, sample_rate=22050, buffer=512, channels=1, reserved=4, history=100):
+        self.sample_rate = sample_rate
+        self.buffer = buffer
+        self.channels = channels
+        self.reserved = reserved
+        self.available = False
+        self.feedback_channels = []
+        self.stream_channel = None              # 序列播放专用声道
+        self.latencies = deque(maxlen=history)   # (事件->play() 延迟, 当帧事件轮询间隔)，秒
+        self.polled_at = 0.0
+        self.poll_interval = 0.0
+        self._next_channel = 0
+
+    def pre_init(self):
+        """必须在 pygame.init() 之前调用，否则 pygame.init() 会以默认参数打开混音器"""
+        pygame.mixer.pre_init(frequency=self.sample_rate, size=-16, channels=self.channels, buffer=self.buffer)
+
+    def open(self):
+        """读取混音器实际打开的参数并建立反馈声道池"""
+        if not pygame.mixer.get_init():
+            try:
+                pygame.mixer.init()
+            except pygame.error as e:
+                print(f"Audio disabled: {e}")
+                return
+        # 设备可能不支持请求的参数，以实际值为准
+        self.sample_rate, _, self.channels = pygame.mixer.get_init()
+        pygame.mixer.set_num_channels(max(pygame.mixer.get_num_channels(), self.reserved + 5))
+        pygame.mixer.set_reserved(self.reserved + 1)
+        self.feedback_channels = [pygame.mixer.Channel(i) for i in range(self.reserved)]
+        self.stream_channel = pygame.mixer.Channel(self.reserved)
+        self.available = True
+
+    def buffer_latency(self):
+        """混音器缓冲区带来的输出延迟（秒）"""
+        return self.buffer / self.sample_rate
+
+    def poll_events(self, wait_ms=None):
+        """取出事件队列，并记下取事件的时刻，作为本帧按键的起点。
+
+        wait_ms 不为 None 时先阻塞等待第一个事件（最多 wait_ms 毫秒），空闲时不占用 CPU。
+        """
+        if wait_ms is None:
+            events = pygame.event.get()
+        else:
+            first = pygame.event.wait(wait_ms)
+            events = [] if first.type == pygame.NOEVENT else [first] + pygame.event.get()
+        now = time.perf_counter()
+        if wait_ms is not None and events:
+            # 事件一到就被唤醒，几乎没有在队列中等待
+            self.poll_interval = 0.0
+        else:
+            self.poll_interval = now - self.polled_at if self.polled_at else 0.0
+        self.polled_at = now
+        return events
+
+    def play_feedback(self, sound):
+        """在预留声道上播放：优先空闲声道，都在忙时轮流覆盖"""
+        if not self.available:
+            return
+        channel = None
+        for candidate in self.feedback_channels:
+            if not candidate.get_busy():
+                channel = candidate
+                break
+        if channel is None:
+            channel = self.feedback_channels[self._next_channel]
+            self._next_channel = (self._next_channel + 1) % len(self.feedback_channels)
+        channel.play(sound)
+        if self.polled_at:
+            self.latencies.append((time.perf_counter() - self.polled_at, self.poll_interval))
+
+    def latency_stats(self):
+        """按键延迟统计（毫秒）；队列等待无法直接测量，按轮询间隔的一半估计"""
+        if not self.latencies:
+            return None
+        measured = sorted(latency for latency, _ in self.latencies)
+        queue_wait = sum(interval for _, interval in self.latencies) / len(self.latencies) / 2
+        return {
+            'samples': len(measured),
+            'last_ms': self.latencies[-1][0] * 1000,
+            'median_ms': measured[len(measured) // 2] * 1000,
+            'max_ms': measured[-1] * 1000,
+            'queue_wait_ms': queue_wait * 1000,
+            'buffer_ms': self.buffer_latency() * 1000,
+            'estimated_total_ms': (measured[len(measured) // 2] + queue_wait + self.buffer_latency()) * 1000,
+        }
+
+AUDIO = AudioBackend()
+
+# --- 序列播放 ---
+# 旋律、音程、和弦等由 tone_synth.render_sequence 渲染成一条连续音频流，按块排入专用声道的队列；
+# 块与块在混音器中首尾相接，节奏不受帧率抖动影响。游戏循环每帧调用 pump() 补充下一块。
+class SequencePlayer:
+    def __init__(self, chunk_seconds=0.25, timbre='piano'):
+        self.chunk_seconds = chunk_seconds
+        self.timbre = timbre
+        self._chunks = None
+
+    def play(self, events, gain=0.5):
+        """events 为按起始时间排序的 (起始秒, 时长秒, 音符名或频率)"""
+        if not AUDIO.available:
+            return
+        events = ((onset, duration, note_frequency(note) if isinstance(note, str) else note)
+                  for onset, duration, note in events)
+        self._chunks = render_sequence(events, AUDIO.sample_rate, TIMBRES[self.timbre], AUDIO.channels,
+                                       int(self.chunk_seconds * AUDIO.sample_rate), gain)
+        AUDIO.stream_channel.stop()
+        self._queue_next(start=True)
+
+    def _queue_next(self, start=False):
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._chunks = None
+            return
+        sound = pygame.sndarray.make_sound(chunk)
+        if start:
+            AUDIO.stream_channel.play(sound)
+        else:
+            AUDIO.stream_channel.queue(sound)
+
+    def pump(self):
+        """声道的等待队列空出来时排入下一块"""
+        if self._chunks is not None and AUDIO.stream_channel.get_queue() is None:
+            self._queue_next()
+
+    def is_playing(self):
+        return self._chunks is not None or (AUDIO.available and AUDIO.stream_channel.get_busy())
+
+    def stop(self):
+        self._chunks = None
+        if AUDIO.available:
+            AUDIO.stream_channel.stop()
+
+SEQUENCE_PLAYER = SequencePlayer()
+
+def interval_drill(reference, note):
+    """音程练习：先后弹参考音和目标音（旋律音程），再同时弹（和声音程）"""
+    return [(0.0, 0.6, reference), (0.6, 0.6, note), (1.3, 1.0, reference), (1.3, 1.0, note)]
+
+# --- 麦克风作答 ---
+# 可选（--mic）：SDL 采集回调把采样交给 pitch_detect.PitchWorker 在后台线程分析，检测到稳定的音符时
+# 投递对应的数字键事件，所以唱出/弹出的答案和按键走同一条路径（也会记进练习日志、可以回放）。
+class MicrophoneInput:
+    def __init__(self, block=256):
+        self.block = block          # 每次采集回调的采样数
+        self.device = None
+        self.worker = None
+        self.error = None
+        self.last_note = None
+
+    def open(self, sample_rate):
+        """打开第一个采集设备（处于暂停状态）；失败时返回 False，原因记在 error 中"""
+        try:
+            from pygame._sdl2 import audio as sdl_audio
+        except ImportError as e:
+            self.error = str(e)
+            return False
+        try:
+            names = sdl_audio.get_audio_device_names(True)
+            if not names:
+                raise pygame.error("no capture device found")
+            self.worker = PitchWorker(PitchStream(sample_rate), on_note=self._on_note)
+            self.device = sdl_audio.AudioDevice(names[0], True, sample_rate, sdl_audio.AUDIO_S16, 1,
+                                                self.block, 0, self._capture)
+        except (pygame.error, sdl_audio.error) as e:
+            self.error = str(e)
+            self.close()
+            return False
+        return True
+
+    def _capture(self, device, memory):
+        # 在 SDL 的音频线程中调用：只复制采样并交给后台线程，不做任何分析
+        self.worker.submit(np.frombuffer(bytes(memory), dtype=np.int16))
+
+    def _on_note(self, note):
+        # 反馈音或音序还在播放时忽略，免得扬声器里的声音被当成作答
+        if AUDIO.available and (SEQUENCE_PLAYER.is_playing()
+                                or any(channel.get_busy() for channel in AUDIO.feedback_channels)):
+            return
+        self.last_note = note
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_1 + NOTE_LETTERS.index(note[0]),
+                                             mod=0, unicode='', scancode=0))
+
+    def listen(self, enabled):
+        """只在练习界面采集，其余时间暂停设备"""
+        if self.device is None:
+            return
+        self.worker.tracker.reset()
+        self.device.pause(0 if enabled else 1)
+
+    def close(self):
+        if self.device is not None:
+            self.device.close()
+            self.device = None
+        if self.worker is not None:
+            self.worker.close()
+            self.worker = None
+
+MIC = MicrophoneInput()
+
+# --- 烟花粒子系统 ---
+# 所有粒子以“结构数组”形式存放在预分配的 numpy 数组中：
+# 每帧一次向量化更新整个粒子池，死亡的槽位直接复用，绘制时按 (颜色, 尺寸) 批量 blit。
+FIREWORK_COLORS = [(255, 50, 50), (50, 255, 50), (50, 50, 255),
+                   (255, 255, 50), (255, 50, 255), (50, 255, 255)]
+PARTICLE_LIFETIME = 60    # 存活的模拟步数（见 FixedTimestep）
+PARTICLE_GRAVITY = 0.15
+PARTICLE_DRAG = 0.98
+PARTICLE_MAX_SIZE = 4
+PARTICLES_PER_FIREWORK = 50
+
+class ParticlePool:
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.pos = np.zeros((capacity, 2), dtype=np.float32)
+        self.vel = np.zeros((capacity, 2), dtype=np.float32)
+        self.life = np.zeros(capacity, dtype=np.int16)
+        self.color = np.zeros(capacity, dtype=np.uint8)   # FIREWORK_COLORS 的下标
+        self._sprites = {}
+        self.updates = 0     # update() 调用次数，用作渲染图层的内容标识
+
+    def emit(self, x, y, color_index, count=PARTICLES_PER_FIREWORK):
+        """在 (x, y) 发射 count 个粒子，池满时多余的粒子被丢弃"""
+        slots = np.flatnonzero(self.life <= 0)[:count]
+        n = len(slots)
+        if n == 0:
+            return 0
+        angle = np.random.uniform(0, 2 * math.pi, n)
+        speed = np.random.uniform(2, 8, n)
+        self.pos[slots] = (x, y)
+        self.vel[slots, 0] = np.cos(angle) * speed
+        self.vel[slots, 1] = np.sin(angle) * speed
+        self.life[slots] = PARTICLE_LIFETIME
+        self.color[slots] = color_index
+        return n
+
+    def burst(self, x, y):
+        """发射一个随机颜色的烟花"""
+        return self.emit(x, y, random.randrange(len(FIREWORK_COLORS)))
 
-# 预生成所有音符的声音
-print("Generating note sounds...")
-NOTE_SOUNDS = {note: generate_tone(freq) for note, freq in NOTE_FREQUENCIES.items()}
-print("Sound generation complete!")
-
-
-# --- 烟花粒子类 ---
-class Particle:
-    def __init__(self, x, y, color):
-        self.x = x
-        self.y = y
-        angle = random.uniform(0, 2 * math.pi)
-        speed = random.uniform(2, 8)
-        self.vx = math.cos(angle) * speed
-        self.vy = math.sin(angle) * speed
-        self.color = color
-        self.life = 60  # 存活帧数
-        self.gravity = 0.15
-        
-    def update(self):
-        self.vx *= 0.98
-        self.vy += self.gravity
-        self.x += self.vx
-        self.y += self.vy
-        self.life -= 1
-        
-    def draw(self, screen):
-        if self.life > 0:
-            alpha = int(255 * (self.life / 60))
-            size = max(1, int(4 * (self.life / 60)))
-            pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), size)
-
-class Firework:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.particles = []
-        colors = [(255, 50, 50), (50, 255, 50), (50, 50, 255), 
-                  (255, 255, 50), (255, 50, 255), (50, 255, 255)]
-        color = random.choice(colors)
-        for _ in range(50):
-            self.particles.append(Particle(x, y, color))
-    
     def update(self):
-        for particle in self.particles:
-            particle.update()
-        self.particles = [p for p in self.particles if p.life > 0]
-    
+        alive = self.life > 0
+        self.vel[alive, 0] *= PARTICLE_DRAG
+        self.vel[alive, 1] += PARTICLE_GRAVITY
+        self.pos[alive] += self.vel[alive]
+        self.life[alive] -= 1
+        self.updates += 1
+
+    def _sprite(self, color_index, size):
+        key = (color_index, size)
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            sprite = pygame.Surface((size * 2 + 1, size * 2 + 1), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, FIREWORK_COLORS[color_index], (size, size), size)
+            self._sprites[key] = sprite
+        return sprite
+
     def draw(self, screen):
-        for particle in self.particles:
-            particle.draw(screen)
-    
+        idx = np.flatnonzero(self.life > 0)
+        if len(idx) == 0:
+            return
+        sizes = np.maximum(1, (PARTICLE_MAX_SIZE * self.life[idx]) // PARTICLE_LIFETIME)
+        xy = self.pos[idx].astype(np.int32) - sizes[:, None]
+        sprite = self._sprite
+        screen.blits([(sprite(c, s), (x, y))
+                      for c, s, (x, y) in zip(self.color[idx].tolist(), sizes.tolist(), xy.tolist())],
+                     doreturn=False)
+
+    def bounds(self):
+        """所有存活粒子的包围矩形（无存活粒子时返回 None）"""
+        idx = np.flatnonzero(self.life > 0)
+        if len(idx) == 0:
+            return None
+        lo = self.pos[idx].min(axis=0).astype(int) - PARTICLE_MAX_SIZE
+        hi = self.pos[idx].max(axis=0).astype(int) + PARTICLE_MAX_SIZE + 2
+        return pygame.Rect(int(lo[0]), int(lo[1]), int(hi[0] - lo[0]), int(hi[1] - lo[1]))
+
+    def active_count(self):
+        return int(np.count_nonzero(self.life > 0))
+
     def is_finished(self):
-        return len(self.particles) == 0
+        return not self.life.any()
+
+    def clear(self):
+        self.life[:] = 0
+
+# --- 帧率与固定步长 ---
+# 画面没有动画时主循环阻塞在 pygame.event.wait 上，不再空转；烟花和提示的计时按固定步长的模拟时钟推进，
+# 与实际帧率无关，所以限帧省电或掉帧时动画速度不变。
+SIM_STEP = 1 / 60         # 模拟步长（秒）；粒子参数按每秒 60 步标定
+MAX_SIM_STEPS = 8         # 一帧最多补几步，卡顿之后不会一下子快进
+IDLE_TIMEOUT_MS = 1000    # 空闲时最长等待多久醒来一次
+FEEDBACK_SECONDS = 1.0    # "Correct!" 等提示的显示时长
+GAME_FPS = 60             # 有动画时的帧率上限
+MENU_FPS = 30
+POWER_SAVE_DIVISOR = 2    # 省电模式下帧率上限减半
+
+class FixedTimestep:
+    """固定步长的模拟时钟：每次 advance 按经过的真实时间执行整数步 update，余下的留到下一帧"""
+
+    def __init__(self, step=SIM_STEP, max_steps=MAX_SIM_STEPS):
+        self.step = step
+        self.max_steps = max_steps
+        self.time = 0.0           # 模拟时间（秒）
+        self._accumulator = 0.0
+        self._last = time.perf_counter()
+
+    def advance(self, update=None):
+        """推进到当前时刻，返回执行 update 的步数；update 为 None 表示没有要模拟的东西，只推进时间"""
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        if update is None:
+            self.time += elapsed
+            self._accumulator = 0.0
+            return 0
+        self._accumulator += min(elapsed, self.step * self.max_steps)
+        steps = 0
+        while self._accumulator >= self.step:
+            update()
+            self._accumulator -= self.step
+            self.time += self.step
+            steps += 1
+        return steps
+
+def on_battery():
+    """是否正在用电池供电；目前只识别 Linux 的 /sys/class/power_supply，其他平台返回 False"""
+    root = '/sys/class/power_supply'
+    try:
+        supplies = os.listdir(root)
+    except OSError:
+        return False
+    for name in supplies:
+        try:
+            with open(os.path.join(root, name, 'type')) as f:
+                kind = f.read().strip()
+            with open(os.path.join(root, name, 'status')) as f:
+                status = f.read().strip()
+        except OSError:
+            continue
+        if kind == 'Battery' and status == 'Discharging':
+            return True
+    return False
+
+def configure_frame_rate(power_save='auto', max_fps=None):
+    """设置帧率上限；power_save 为 'on'、'off' 或 'auto'（用电池时自动省电）。返回是否处于省电模式"""
+    global GAME_FPS, MENU_FPS
+    saving = power_save == 'on' or (power_save == 'auto' and on_battery())
+    GAME_FPS, MENU_FPS = 60, 30
+    if saving:
+        GAME_FPS //= POWER_SAVE_DIVISOR
+        MENU_FPS //= POWER_SAVE_DIVISOR
+    if max_fps:
+        GAME_FPS, MENU_FPS = min(GAME_FPS, max_fps), min(MENU_FPS, max_fps)
+    return saving
 
 # Helper for PyInstaller --onefile: resource_path will return
 # the path to bundled resources when running inside a PyInstaller
@@ -156,40 +508,442 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+# --- 资源缓存 ---
+# 解码、缩放后的图片按 (路径, 目标尺寸, 变换) 缓存，超出内存上限时按 LRU 淘汰。
+# convert_alpha 得到的 Surface 依赖当前显示模式的像素格式，切换显示模式时需整体失效。
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+# 用户数据目录（磁盘缓存等）
+USER_DATA_DIR = os.path.join(os.path.expanduser('~'), '.music_note_game')
+
+def asset_path(name):
+    return resource_path(os.path.join(ASSETS_DIR, name))
+
+def surface_nbytes(surface):
+    return surface.get_pitch() * surface.get_height() if surface is not None else 0
+
+def keep_dark_pixels(surface, threshold=40):
+    """只保留黑色像素：RGB 均低于阈值的像素改为纯黑，其余像素设为全透明（原地修改）"""
+    rgb = pygame.surfarray.pixels3d(surface)
+    alpha = pygame.surfarray.pixels_alpha(surface)
+    dark = (rgb < threshold).all(axis=2)
+    rgb[dark] = 0
+    alpha[~dark] = 0
+    # 释放像素视图，解除 Surface 锁定
+    del rgb, alpha
+    return surface
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def surface_from_buffer(pixels, size):
+    """用 BGRA 像素缓冲区直接构造 Surface（不复制）；像素格式与显示模式不一致时才转换一次"""
+    surface = pygame.image.frombuffer(pixels, size, 'BGRA')
+    if pygame.display.get_surface() is not None and \
+            surface.get_masks() != pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha().get_masks():
+        surface = surface.convert_alpha()
+    return surface
+
+class AssetCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._items = OrderedDict()
+        self.transforms = {'ink': keep_dark_pixels}   # 变换名 -> fn(surface) -> surface
+        # 经过变换的资源额外按源文件哈希保存到磁盘，下次启动直接读取
+        self.disk_dir = disk_dir
+        self.pack = None   # 预构建的资源包（见 asset_pack），优先于磁盘缓存
+
+    def get_or_build(self, key, build):
+        """命中则返回缓存项（并标记为最近使用），否则调用 build() 生成并缓存"""
+        if key in self._items:
+            self._items.move_to_end(key)
+            return self._items[key]
+        value = build()
+        self._items[key] = value
+        self.used_bytes += surface_nbytes(value)
+        self._evict()
+        return value
+
+    def image(self, path, height=None, transform=None):
+        """加载图片，可选地先应用命名变换，再等比缩放到指定高度；文件缺失或损坏时返回 None"""
+        return self.get_or_build((path, height, transform),
+                                 lambda: self._load(path, height, transform))
+
+    def _load(self, path, height, transform):
+        if self.pack is not None:
+            # 源文件还在时按哈希确认包里的版本没有过期
+            packed = self.pack.image(os.path.basename(path), height, transform,
+                                     file_digest(path) if os.path.exists(path) else None)
+            if packed is not None:
+                return surface_from_buffer(*packed)
+        if not os.path.exists(path):
+            print(f"Asset not found: {path}")
+            return None
+        try:
+            disk_path = self._disk_path(path, height, transform)
+            if disk_path and os.path.exists(disk_path):
+                return pygame.image.load(disk_path).convert_alpha()
+            img = pygame.image.load(path).convert_alpha()
+            if transform is not None:
+                img = self.transforms[transform](img)
+            if height is not None:
+                width = int(img.get_width() * (height / img.get_height()))
+                img = pygame.transform.smoothscale(img, (width, height))
+            if disk_path:
+                self._save(img, disk_path)
+            return img
+        except Exception as e:
+            print(f"Failed to load {path}: {e}")
+            return None
+
+    def _disk_path(self, path, height, transform):
+        if self.disk_dir is None or transform is None:
+            return None
+        return os.path.join(self.disk_dir, f"{file_digest(path)}-{transform}-{height}.png")
+
+    def _save(self, img, disk_path):
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            pygame.image.save(img, disk_path)
+        except Exception as e:
+            print(f"Failed to write asset cache {disk_path}: {e}")
+
+    def _evict(self):
+        # 至少保留最新的一项，避免单个超大资源被立即淘汰
+        while self.used_bytes > self.max_bytes and len(self._items) > 1:
+            _, value = self._items.popitem(last=False)
+            self.used_bytes -= surface_nbytes(value)
+
+    def invalidate(self):
+        self._items.clear()
+        self.used_bytes = 0
+
+ASSET_CACHE = AssetCache(disk_dir=os.path.join(USER_DATA_DIR, 'cache'))
+
+def set_display_mode(size, flags=0):
+    """切换显示模式，并让依赖旧像素格式的缓存资源失效"""
+    global screen
+    screen = pygame.display.set_mode(size, flags)
+    ASSET_CACHE.invalidate()
+    return screen
+
+# --- 预构建资源包 ---
+# 由 `python asset_pack.py build` 生成；启动时内存映射，谱号图片和音符 PCM 不必再解码、缩放或合成。
+# 包不存在或已过期时照常在运行时生成。
+ASSET_PACK_PATH = asset_path(PACK_NAME)
+MENU_CLEF_HEIGHT = 80
+STAFF_CLEF_HEIGHT = 240
+ASSET_PACK = None
+
+def pack_images():
+    """打进资源包的图片 (文件名, 高度, 变换)，与菜单和各谱号实际请求的一致"""
+    images = [('g-clef.png', MENU_CLEF_HEIGHT, None), ('f-clef.png', MENU_CLEF_HEIGHT, None)]
+    images += [(clef.image, STAFF_CLEF_HEIGHT, 'ink') for clef in CLEFS.values() if clef.image]
+    return list(dict.fromkeys(images))
+
+def load_asset_pack(path=None):
+    """映射资源包并交给图片缓存和音色库；没有可用的包时返回 None"""
+    global ASSET_PACK
+    ASSET_PACK = AssetPack.open(path or ASSET_PACK_PATH)
+    ASSET_CACHE.pack = SOUND_BANK.pack = ASSET_PACK
+    return ASSET_PACK
+
+
+# --- 文字渲染缓存 ---
+# 每种字号的字体只创建一次；渲染好的文字 Surface 按 (字体, 文字, 颜色, 抗锯齿) 缓存，LRU 淘汰。
+# 经常变化的文字（如分数）用 compose() 由若干缓存片段（单个数字等）拼接，而不是整行重新光栅化。
+class TextCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._fonts = {}
+        self._surfaces = OrderedDict()
+
+    def font(self, size, name=None):
+        key = (name, size)
+        font = self._fonts.get(key)
+        if font is None:
+            font = self._fonts[key] = pygame.font.Font(name, size)
+        return font
+
+    def _lookup(self, key):
+        surface = self._surfaces.get(key)
+        if surface is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._surfaces.move_to_end(key)
+        return surface
+
+    def _store(self, key, surface):
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.max_entries:
+            self._surfaces.popitem(last=False)
+        return surface
+
+    def render(self, text, size, color, antialias=True, name=None):
+        key = ((name, size), text, color, antialias)
+        surface = self._lookup(key)
+        if surface is None:
+            surface = self._store(key, self.font(size, name).render(text, antialias, color))
+        return surface
+
+    def compose(self, parts, size, color, antialias=True, name=None):
+        """把各自缓存的文字片段横向拼接成一行"""
+        parts = tuple(parts)
+        key = ((name, size), parts, color, antialias)
+        surface = self._lookup(key)
+        if surface is None:
+            pieces = [self.render(part, size, color, antialias, name) for part in parts]
+            surface = pygame.Surface((sum(p.get_width() for p in pieces),
+                                      max(p.get_height() for p in pieces)), pygame.SRCALPHA)
+            x = 0
+            for piece in pieces:
+                # 片段互不重叠，用 RGBA_MAX 直接拷贝像素，避免与透明底色混合
+                surface.blit(piece, (x, 0), special_flags=pygame.BLEND_RGBA_MAX)
+                x += piece.get_width()
+            self._store(key, surface)
+        return surface
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._surfaces)}
+
+    def clear(self):
+        """pygame.quit() 之后字体对象失效，重新初始化前需清空"""
+        self._fonts.clear()
+        self._surfaces.clear()
+
+TEXT_CACHE = TextCache()
+
+def score_parts(score, prefix, suffix):
+    """分数行拆成 前缀 + 单个数字 + 后缀，数字片段在不同分数间复用"""
+    return (prefix, *str(score), suffix)
+
+# --- 分层脏矩形渲染 ---
+# 静态背景（五线谱等）每种谱号只预渲染一次；每帧只重画内容发生变化的图层所覆盖的区域，
+# 调用方再用 pygame.display.update(rects) 只提交这些区域。画面没有变化时完全跳过提交。
+# 图层按绘制顺序给出：name 标识图层，key 描述其内容（key 不变即认为内容未变），
+# rect 为其在屏幕上的包围矩形，draw(screen) 负责绘制。
+Layer = namedtuple('Layer', 'name key rect draw')
+
+# 窗口被遮挡后重新露出或从最小化恢复时，窗口内容可能已丢失，需要整屏重画（见 DirtyRenderer.invalidate）
+EXPOSE_EVENTS = (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED, pygame.WINDOWSHOWN)
+
+def blit_layer(name, key, surface, pos):
+    return Layer(name, key, surface.get_rect(topleft=pos), lambda target: target.blit(surface, pos))
+
+def merge_rects(rects):
+    """合并相互重叠的矩形，减少重复恢复背景和重绘"""
+    merged = []
+    for rect in rects:
+        rect = rect.copy()
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+class DirtyRenderer:
+    def __init__(self, background):
+        self.background = background
+        self._layers = {}          # name -> (key, rect)，记录上一帧提交的内容
+        self._full_redraw = True
+
+    def invalidate(self):
+        """下一帧整屏重画（例如窗口被遮挡或切换了显示模式）"""
+        self._full_redraw = True
+
+    def render(self, target, layers):
+        """绘制本帧的变化区域，返回需要提交的矩形列表（画面未变化时为空）"""
+        bounds = target.get_rect()
+        if self._full_redraw:
+            dirty = [bounds]
+        else:
+            dirty = []
+            current = {layer.name for layer in layers}
+            for name, (key, rect) in self._layers.items():
+                if name not in current and rect:
+                    dirty.append(rect)
+            for layer in layers:
+                prev = self._layers.get(layer.name)
+                if prev is None or prev[0] != layer.key:
+                    if prev is not None and prev[1]:
+                        dirty.append(prev[1])
+                    if layer.rect:
+                        dirty.append(layer.rect)
+            dirty = [r for r in (rect.clip(bounds) for rect in merge_rects(dirty)) if r.w and r.h]
+        self._layers = {layer.name: (layer.key, layer.rect) for layer in layers}
+        self._full_redraw = False
+        if not dirty:
+            return dirty
+        # 逐个脏区域：先恢复背景，再按顺序裁剪重绘与之相交的图层
+        for rect in dirty:
+            target.set_clip(rect)
+            target.blit(self.background, rect, rect)
+            for layer in layers:
+                if layer.rect and layer.rect.colliderect(rect):
+                    layer.draw(target)
+        target.set_clip(None)
+        return dirty
+
+def note_head_layer(key, x, y, radius, hole, ledger_ys, ledger_half_width):
+    """音符符头（空心圆）及加线组成的图层"""
+    y = int(y)
+    top = min([y - radius] + [ly - 1 for ly in ledger_ys])
+    bottom = max([y + radius] + [ly + 1 for ly in ledger_ys])
+    half = max(radius, ledger_half_width)
+    rect = pygame.Rect(x - half, top, half * 2 + 1, bottom - top + 1)
+    def draw(target):
+        pygame.draw.circle(target, BLACK, (x, y), radius)
+        pygame.draw.circle(target, WHITE, (x, y), hole)
+        for ly in ledger_ys:
+            pygame.draw.line(target, BLACK, (x - ledger_half_width, ly), (x + ledger_half_width, ly), 2)
+    return Layer('note', key, rect, draw)
+
+def build_staff_background(line_ys, staff_x, staff_w):
+    """预渲染某个谱号的静态背景：白底 + 五线"""
+    background = pygame.Surface((WIDTH, HEIGHT)).convert()
+    background.fill(WHITE)
+    for y in line_ys:
+        pygame.draw.line(background, BLACK, (staff_x, y), (staff_x + staff_w, y), 2)
+    return background
+
+def fireworks_layer(fireworks):
+    return Layer('fireworks', fireworks.updates, fireworks.bounds(), fireworks.draw)
+
+# --- 帧分析器 ---
+# 每帧按阶段（事件处理 / 更新 / 绘制 / 提交 / clock.tick 等待）计时，写入预分配的环形缓冲区。
+# 按 F3 显示叠加层：最近若干帧的帧耗时直方图和 FPS。未启用时每个打点只是一次属性判断。
+PROFILE_PHASES = ('events', 'update', 'draw', 'present', 'tick')
+PROFILE_HOTKEY = pygame.K_F3
+OVERLAY_SIZE = (240, 120)
+HISTOGRAM_BINS = np.linspace(0, 40, 21)    # 0~40ms，每格 2ms
+
+class FrameProfiler:
+    def __init__(self, capacity=600):
+        self.enabled = False
+        self.overlay_visible = False
+        self.capacity = capacity
+        self.samples = np.zeros((capacity, len(PROFILE_PHASES)))   # 秒
+        self.index = 0          # 当前帧写入的行
+        self.frames = 0         # 已记录的总帧数
+        self.csv_path = None
+        self._csv = None
+        self._phase_index = {name: i for i, name in enumerate(PROFILE_PHASES)}
+        self._last = 0.0
+        self._overlay = None
+
+    def enable(self, csv_path=None):
+        self.enabled = True
+        self.csv_path = csv_path
+        self._last = time.perf_counter()
+
+    def toggle_overlay(self):
+        self.overlay_visible = not self.overlay_visible
+        if self.overlay_visible and not self.enabled:
+            self.enable(self.csv_path)
+
+    def mark(self, phase):
+        """把上一个打点到现在的耗时记入当前帧的指定阶段"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.samples[self.index, self._phase_index[phase]] += now - self._last
+        self._last = now
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.frames += 1
+        self.index += 1
+        if self.index == self.capacity:
+            self._flush(self.capacity)
+            self.index = 0
+        self.samples[self.index] = 0
+
+    def recent(self):
+        """按时间顺序返回缓冲区中已完成的帧（每行各阶段耗时，秒）"""
+        if self.frames < self.capacity:
+            return self.samples[:self.index]
+        # 环形缓冲区已写满：index 行是正在记录的当前帧，之后到末尾是较早的帧，开头到 index 之前是较新的帧
+        return np.concatenate((self.samples[self.index + 1:], self.samples[:self.index]))
+
+    def _flush(self, rows):
+        if self.csv_path is None or rows == 0:
+            return
+        if self._csv is None:
+            self._csv = open(self.csv_path, 'w')
+            self._csv.write('frame,' + ','.join(f"{name}_ms" for name in PROFILE_PHASES) + ',total_ms\n')
+        block = self.samples[:rows] * 1000
+        first = self.frames - rows
+        for i, row in enumerate(block):
+            self._csv.write(f"{first + i}," + ','.join(f"{v:.3f}" for v in row) + f",{row.sum():.3f}\n")
+
+    def close(self):
+        """退出时写出缓冲区中剩余的帧"""
+        if self.enabled:
+            self._flush(self.index)
+        if self._csv is not None:
+            self._csv.close()
+            self._csv = None
+
+    def overlay(self):
+        """绘制叠加层：帧耗时直方图（横轴 0~40ms）、FPS 和各阶段平均耗时"""
+        if self._overlay is None:
+            self._overlay = pygame.Surface(OVERLAY_SIZE, pygame.SRCALPHA)
+        surface = self._overlay
+        surface.fill((20, 20, 30, 200))
+        frames = self.recent()
+        if len(frames):
+            totals = frames.sum(axis=1) * 1000
+            counts, _ = np.histogram(np.minimum(totals, HISTOGRAM_BINS[-1] - 1e-6), HISTOGRAM_BINS)
+            bar_w = OVERLAY_SIZE[0] // len(counts)
+            scale = 60 / max(1, counts.max())
+            for i, count in enumerate(counts.tolist()):
+                h = int(count * scale)
+                # 超过 16.7ms（60 FPS 预算）的柱子用红色
+                color = (90, 200, 90) if HISTOGRAM_BINS[i + 1] <= 1000 / 60 else (220, 90, 90)
+                pygame.draw.rect(surface, color, (i * bar_w, OVERLAY_SIZE[1] - h, bar_w - 1, h))
+            means = frames.mean(axis=0) * 1000
+            fps = 1000 / totals.mean() if totals.mean() > 0 else 0
+            surface.blit(TEXT_CACHE.render(f"FPS {fps:5.1f}  frame {totals.mean():5.2f}ms", 20, WHITE), (6, 4))
+            work = '  '.join(f"{name[0]}{v:.1f}" for name, v in zip(PROFILE_PHASES[:-1], means[:-1].tolist()))
+            surface.blit(TEXT_CACHE.render(work, 20, WHITE), (6, 22))
+        return surface
+
+PROFILER = FrameProfiler()
+
+def profiler_layer():
+    """叠加层作为最上层图层，每帧都视为已变化"""
+    surface = PROFILER.overlay()
+    return blit_layer('profiler', PROFILER.frames, surface, (WIDTH - OVERLAY_SIZE[0] - 10, HEIGHT - OVERLAY_SIZE[1] - 10))
+
 # --- UI选择界面 ---
-def draw_menu():
+def build_menu_background():
+    """预渲染菜单的静态背景：渐变 + 带阴影的标题"""
+    background = pygame.Surface((WIDTH, HEIGHT)).convert()
     # 渐变背景
     for y in range(HEIGHT):
         color = (220 - y//20, 230 - y//30, 255)
-        pygame.draw.line(screen, color, (0, y), (WIDTH, y))
+        pygame.draw.line(background, color, (0, y), (WIDTH, y))
     # 顶部英文提示（加粗加阴影）
-    font = pygame.font.Font(None, 54)
-    tip = font.render("Select one clef you want to practice.", True, (40,40,80))
-    shadow = font.render("Select one clef you want to practice.", True, (180,180,220))
-    screen.blit(shadow, (WIDTH//2 - tip.get_width()//2 + 2, 62))
-    screen.blit(tip, (WIDTH//2 - tip.get_width()//2, 60))
-    # 加载高音谱号和低音谱号图片（始终显示）
-    assets_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
-    gclef_path = resource_path(os.path.join(assets_dir, 'g-clef.png'))
-    fclef_path = resource_path(os.path.join(assets_dir, 'f-clef.png'))
-    gclef_img = None
-    fclef_img = None
-    try:
-        if os.path.exists(gclef_path):
-            gclef_img = pygame.image.load(gclef_path).convert_alpha()
-            scale_height = 80
-            scale_width = int(gclef_img.get_width() * (scale_height / gclef_img.get_height()))
-            gclef_img = pygame.transform.smoothscale(gclef_img, (scale_width, scale_height))
-    except Exception as e:
-        gclef_img = None
-    try:
-        if os.path.exists(fclef_path):
-            fclef_img = pygame.image.load(fclef_path).convert_alpha()
-            scale_height = 80
-            scale_width = int(fclef_img.get_width() * (scale_height / fclef_img.get_height()))
-            fclef_img = pygame.transform.smoothscale(fclef_img, (scale_width, scale_height))
-    except Exception as e:
-        fclef_img = None
+    tip = TEXT_CACHE.render("Select one clef you want to practice.", 54, (40,40,80))
+    shadow = TEXT_CACHE.render("Select one clef you want to practice.", 54, (180,180,220))
+    background.blit(shadow, (WIDTH//2 - tip.get_width()//2 + 2, 62))
+    background.blit(tip, (WIDTH//2 - tip.get_width()//2, 60))
+    hint = TEXT_CACHE.render("Press D for audio diagnostics, S for sight-reading", 24, (90,90,130))
+    background.blit(hint, (WIDTH//2 - hint.get_width()//2, HEIGHT - 40))
+    return background
+
+def draw_menu():
+    screen.blit(ASSET_CACHE.get_or_build(('<menu-background>', (WIDTH, HEIGHT), None),
+                                         build_menu_background), (0, 0))
+    # 高音谱号和低音谱号图片（始终显示）
+    gclef_img = ASSET_CACHE.image(asset_path('g-clef.png'), height=MENU_CLEF_HEIGHT)
+    fclef_img = ASSET_CACHE.image(asset_path('f-clef.png'), height=MENU_CLEF_HEIGHT)
 
     # 鼠标悬停高亮
     mx, my = pygame.mouse.get_pos()
@@ -212,265 +966,527 @@ def draw_menu():
         fclef_rect.centery = 320 + 35
         screen.blit(fclef_img, fclef_rect)
 
-    pygame.display.flip()
-
-    print("gclef_path:", gclef_path)
-    if gclef_img:
-        print("g-clef loaded and ready to display")
-    else:
-        print("g-clef NOT loaded")
-
-    print("fclef_path:", fclef_path)
-    if fclef_img:
-        print("f-clef loaded and ready to display")
-    else:
-        print("f-clef NOT loaded")
-
 def menu_loop():
+    # 菜单是静态的：只有收到输入/窗口事件（例如鼠标移动改变悬停高亮）或显示叠加层时才重画
+    redraw = True
+    wait_ms = None  # 第一帧不等待
     while True:
-        draw_menu()
-        for event in pygame.event.get():
+        animating = PROFILER.overlay_visible
+        if redraw or animating:
+            draw_menu()
+            if animating:
+                layer = profiler_layer()
+                layer.draw(screen)
+            PROFILER.mark('draw')
+            pygame.display.flip()
+            PROFILER.mark('present')
+        events = AUDIO.poll_events(None if animating else wait_ms)
+        PROFILER.mark('tick')
+        # 自定义事件（USEREVENT 及以后）不影响菜单画面
+        redraw = any(event.type < pygame.USEREVENT for event in events)
+        for event in events:
             if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+                return None
+            elif event.type == pygame.KEYDOWN and event.key == PROFILE_HOTKEY:
+                PROFILER.toggle_overlay()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_d:
+                return 'audio'
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_s:
+                return 'sight'
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 x, y = event.pos
                 if WIDTH//2-160 < x < WIDTH//2+160 and 220 < y < 290:
                     return 'treble'
                 if WIDTH//2-160 < x < WIDTH//2+160 and 320 < y < 390:
                     return 'bass'
-        clock.tick(30)
-
-# --- 高音谱号识别功能（main.py核心） ---
-def run_treble():
-    STAFF_X = 120
-    STAFF_Y = 300
-    STAFF_W = 600
-    LINE_SPACING = 20
-    note_names = ['C4', 'D4', 'E4', 'F4', 'G4', 'A4', 'B4', 'C5', 'D5', 'E5', 'F5', 'G5', 'A5']
-    note_labels = ['C', 'D', 'E', 'F', 'G', 'A', 'B', 'C', 'D', 'E', 'F', 'G', 'A']
-    note_positions = [STAFF_Y + LINE_SPACING * 5, STAFF_Y + LINE_SPACING * 4.5, STAFF_Y + LINE_SPACING * 4,
-                      STAFF_Y + LINE_SPACING * 3.5, STAFF_Y + LINE_SPACING * 3, STAFF_Y + LINE_SPACING * 2.5,
-                      STAFF_Y + LINE_SPACING * 2, STAFF_Y + LINE_SPACING * 1.5, STAFF_Y + LINE_SPACING * 1,
-                      STAFF_Y + LINE_SPACING * 0.5, STAFF_Y, STAFF_Y - LINE_SPACING * 0.5, STAFF_Y - LINE_SPACING]
-    score = 0
-    current_note = random.choice(range(len(note_names)))
+        PROFILER.mark('events')
+        wait_ms = IDLE_TIMEOUT_MS
+        # 只有画了新的一帧才限帧；空闲等待本身已经让出了 CPU
+        clock.tick(MENU_FPS if redraw or animating else 0)
+        PROFILER.mark('tick')
+        PROFILER.end_frame()
+
+# --- 学习记录 ---
+# 每个谱号一个自适应题库（见 note_scheduler），统计按学习者保存在用户数据目录下。
+SCHEDULERS = {}
+STATS_PATH = None
+
+def load_learner(name):
+    global STATS_PATH
+    STATS_PATH = os.path.join(USER_DATA_DIR, 'stats', f"{name}.json")
+    SCHEDULERS.clear()
+    SCHEDULERS.update(load_schedulers(STATS_PATH))
+
+def save_learner():
+    if STATS_PATH is None:
+        return
+    try:
+        save_schedulers(STATS_PATH, SCHEDULERS)
+    except OSError as e:
+        print(f"Failed to save stats to {STATS_PATH}: {e}")
+
+def clef_scheduler(clef):
+    """取得某个谱号的题库，沿用已保存的统计，音域变化时只保留当前音域内的音符"""
+    saved = SCHEDULERS.get(clef.name)
+    stats = [(saved and saved.stats_for(note)) or NoteStats() for note in clef.note_names]
+    scheduler = SCHEDULERS[clef.name] = NoteScheduler(clef.note_names, stats=stats)
+    return scheduler
+
+def open_session_log(clef, learner):
+    """为一次练习创建事件日志，文件名含开始时间；无法创建时返回 None"""
+    started = time.time()
+    path = os.path.join(USER_DATA_DIR, 'logs',
+                        time.strftime('%Y%m%d-%H%M%S', time.localtime(started)) + f"-{learner}-{clef.name}.mnglog")
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return session_log.EventLog(path, {'clef': clef.name, 'notes': clef.note_names,
+                                           'learner': learner, 'started': started})
+    except OSError as e:
+        print(f"Failed to open session log {path}: {e}")
+        return None
+
+# --- 谱号引擎 ---
+# 每种谱号由一份定义描述：五线谱几何、音域、参考线（第1线上的音）和显示风格。
+# 音符名、y 坐标、加线位置和答案查找表在创建定义时一次性算好，游戏循环中只做查表。
+# 音域和答案表来自 quiz_session.NotePool，与测验服务器共用。
+class Clef:
+    def __init__(self, name, reference, low, high, staff_x=120, staff_top=220, staff_w=660, line_spacing=32,
+                 head_radius=14, head_hole=10, ledger_half_width=22, text_size=32,
+                 score_suffix=" | Keys 1-7 = C~B | Current octave shown | Press SPACE to hear",
+                 correct_color=(0, 180, 0), wrong_format="Wrong! {note}", show_legend=True, show_debug=True,
+                 image=None):
+        self.name = name
+        self.reference = reference
+        self.staff_x = staff_x
+        self.staff_w = staff_w
+        self.line_spacing = line_spacing
+        self.head_radius = head_radius
+        self.head_hole = head_hole
+        self.ledger_half_width = ledger_half_width
+        self.text_size = text_size
+        self.score_suffix = score_suffix
+        self.correct_color = correct_color
+        self.wrong_format = wrong_format
+        self.show_legend = show_legend
+        self.show_debug = show_debug
+        self.image = image
+        self.note_x = staff_x + staff_w // 2
+        # 五线从下（第1线）到上
+        bottom = staff_top + 4 * line_spacing
+        self.line_ys = [bottom - i * line_spacing for i in range(5)]
+
+        ref = diatonic_step(reference)
+        steps = range(diatonic_step(low), diatonic_step(high) + 1)
+        self.pool = NotePool(name, low, high)
+        self.note_names = list(self.pool.notes)
+        self.note_ys = []
+        self.ledger_ys = []
+        for step in steps:
+            offset = step - ref          # 相对第1线的音级数，偶数在线上，奇数在间里
+            self.note_ys.append(bottom - offset * line_spacing // 2)
+            # 第1线以下、第5线以上每隔一个音级一条加线，一直加到音符所在位置
+            if offset <= -2:
+                ledgers = range(-2, offset - 1, -2)
+            elif offset >= 10:
+                ledgers = range(10, offset + 1, 2)
+            else:
+                ledgers = ()
+            self.ledger_ys.append([bottom - d * line_spacing // 2 for d in ledgers])
+        # 每个音符对应的正确按键（0=C ... 6=B）
+        self.answers = self.pool.answers
+
+    def feedback_text(self, index):
+        note = self.note_names[index]
+        return self.wrong_format.format(note=note, letter=note[0])
+
+    def build_background(self):
+        background = build_staff_background(self.line_ys, self.staff_x, self.staff_w)
+        if self.show_legend:
+            info = TEXT_CACHE.render("C=1  D=2  E=3  F=4  G=5  A=6  B=7", 28, BLUE)
+            background.blit(info, (40, 60))
+        return background
+
+CLEFS = {
+    # 高音谱号：第1线 = E4
+    'treble': Clef('treble', *CLEF_RANGES['treble'], staff_top=300, staff_w=600, line_spacing=20,
+                   head_radius=10, head_hole=7, ledger_half_width=18, text_size=36,
+                   score_suffix=" | Which note? Press 1-7 (C=1, D=2...) | Press SPACE to hear",
+                   correct_color=RED, wrong_format="Wrong! It was {letter}",
+                   show_legend=False, show_debug=False),
+    # 低音谱号：第1线 = G2
+    'bass': Clef('bass', *CLEF_RANGES['bass'], image='f-clef.png'),
+    # 中音谱号：第1线 = F3
+    'alto': Clef('alto', *CLEF_RANGES['alto']),
+    # 次中音谱号：第1线 = D3
+    'tenor': Clef('tenor', *CLEF_RANGES['tenor']),
+}
+
+def run_clef(clef, scheduler=None, event_log=None):
+    """练习循环；scheduler 可替换出题顺序（回放时使用），event_log 为 session_log.EventLog"""
+    note_names = clef.note_names
+    # 后台预先合成本模式会用到的音符
+    SOUND_BANK.prewarm(note_names)
+    # 按错误率和反应时间加权出题
+    if scheduler is None:
+        scheduler = clef_scheduler(clef)
+    # 出题、判分和计分由 quiz_session 的状态机负责，这里只管显示、声音和输入
+    session = QuizSession(clef.pool, scheduler, time.perf_counter())
+    if event_log is not None:
+        event_log.log(session_log.NOTE_SHOWN, session.current)
     running = True
     feedback = None
-    feedback_time = 0
-    fireworks = []  # 烟花列表
-    last_firework_score = 0  # 上次触发烟花的分数
+    feedback_until = 0.0  # 提示消失的模拟时刻
+    fireworks = ParticlePool()  # 烟花粒子池
+    timestep = FixedTimestep()
+    wait_ms = None  # 第一帧不等待，先画出来
     # 不自动播放初始音符，等待用户交互
-    # 不显示谱号图片
+    # 谱号图片目前不显示，只预先加载到缓存（只保留黑色像素并缩放为240像素高）
+    if clef.image:
+        ASSET_CACHE.image(asset_path(clef.image), height=STAFF_CLEF_HEIGHT, transform='ink')
+    renderer = DirtyRenderer(ASSET_CACHE.get_or_build(('<staff>', clef.name, (WIDTH, HEIGHT)),
+                                                      clef.build_background))
     while running:
-        screen.fill(WHITE)
-        for i in range(5):
-            y = STAFF_Y + i * LINE_SPACING
-            pygame.draw.line(screen, BLACK, (STAFF_X, y), (STAFF_X + STAFF_W, y), 2)
-        note_x = STAFF_X + STAFF_W // 2
-        note_y = note_positions[current_note]
-        pygame.draw.circle(screen, BLACK, (note_x, int(note_y)), 10)
-        pygame.draw.circle(screen, WHITE, (note_x, int(note_y)), 7)
-        if current_note <= 1:
-            for i in range(2 - current_note):
-                y = STAFF_Y + LINE_SPACING * (5 - i)
-                pygame.draw.line(screen, BLACK, (note_x - 18, y), (note_x + 18, y), 2)
-        if current_note >= 9:
-            for i in range(current_note - 8):
-                y = STAFF_Y - LINE_SPACING * i
-                pygame.draw.line(screen, BLACK, (note_x - 18, y), (note_x + 18, y), 2)
-        font = pygame.font.Font(None, 36)
-        text = font.render(f"Score: {score} | Which note? Press 1-7 (C=1, D=2...) | Press SPACE to hear", True, BLACK)
-        screen.blit(text, (40, 20))
-        for event in pygame.event.get():
+        events = AUDIO.poll_events(wait_ms)
+        PROFILER.mark('tick')
+        # 先把模拟推进到当前时刻，本帧新发射的烟花从下一帧开始计时
+        timestep.advance(None if fireworks.is_finished() else fireworks.update)
+        PROFILER.mark('update')   # 烟花模拟计入 update 阶段（mark 按阶段累加）
+        for event in events:
             if event.type == pygame.QUIT:
+                SEQUENCE_PLAYER.stop()
                 return
+            elif event.type in EXPOSE_EVENTS:
+                renderer.invalidate()
             elif event.type == pygame.KEYDOWN:
+                if event_log is not None:
+                    event_log.log(session_log.KEY, session.current, event.key)
                 if event.key == pygame.K_ESCAPE:
+                    SEQUENCE_PLAYER.stop()
                     return
+                if event.key == PROFILE_HOTKEY:
+                    PROFILER.toggle_overlay()
                 # 按空格键播放当前音符
                 if event.key == pygame.K_SPACE:
-                    if note_names[current_note] in NOTE_SOUNDS:
-                        NOTE_SOUNDS[note_names[current_note]].play()
+                    SOUND_BANK.play(session.note)
+                # 按 I 键听当前音符与第1线音符构成的音程
+                if event.key == pygame.K_i:
+                    SEQUENCE_PLAYER.play(interval_drill(clef.reference, session.note), gain=0.3)
                 if pygame.K_1 <= event.key <= pygame.K_7:
-                    guess = event.key - pygame.K_1
-                    if note_labels[guess] == note_labels[current_note]:
-                        score += 1
-                        feedback = font.render("Correct!", True, RED)
-                        # 答对后播放当前音符（反馈音）
-                        if note_names[current_note] in NOTE_SOUNDS:
-                            NOTE_SOUNDS[note_names[current_note]].play()
-                        current_note = random.choice(range(len(note_names)))
+                    guess = event.key - pygame.K_1  # 0=C, 1=D, 2=E, 3=F, 4=G, 5=A, 6=B
+                    result = session.answer(guess, time.perf_counter())
+                    if event_log is not None:
+                        event_log.log(session_log.ANSWER, result.note, guess, result.correct, result.response_time)
+                    # 答对后播放刚答的音符（反馈音）；答错则播放正确的音符，让用户听到正确答案
+                    SOUND_BANK.play(note_names[result.note])
+                    if result.correct:
+                        feedback = TEXT_CACHE.render("Correct!", clef.text_size, clef.correct_color)
+                        if event_log is not None:
+                            event_log.log(session_log.NOTE_SHOWN, result.next_note)
                         # 每得10分触发烟花
-                        if score % 10 == 0 and score > last_firework_score:
+                        if result.fireworks:
                             for _ in range(3):  # 同时发射3个烟花
                                 fw_x = random.randint(200, WIDTH - 200)
                                 fw_y = random.randint(150, 350)
-                                fireworks.append(Firework(fw_x, fw_y))
-                            last_firework_score = score
+                                fireworks.burst(fw_x, fw_y)
                     else:
-                        # 答错后播放正确的音符（让用户听到正确答案）
-                        if note_names[current_note] in NOTE_SOUNDS:
-                            NOTE_SOUNDS[note_names[current_note]].play()
-                        feedback = font.render(f"Wrong! It was {note_labels[current_note]}", True, RED)
-                    feedback_time = pygame.time.get_ticks()
-        if feedback and pygame.time.get_ticks() - feedback_time < 1000:
+                        feedback = TEXT_CACHE.render(clef.feedback_text(result.note), clef.text_size, RED)
+                    feedback_until = timestep.time + FEEDBACK_SECONDS
+        SEQUENCE_PLAYER.pump()
+        PROFILER.mark('events')
+        current_note, score = session.current, session.score
+        layers = [note_head_layer(current_note, clef.note_x, clef.note_ys[current_note], clef.head_radius,
+                                  clef.head_hole, clef.ledger_ys[current_note], clef.ledger_half_width)]
+        text = TEXT_CACHE.compose(score_parts(score, "Score: ", clef.score_suffix), clef.text_size, BLACK)
+        layers.append(blit_layer('score', score, text, (40, 20)))
+        if clef.show_debug:
+            # 显示当前音符名称（用于调试）
+            debug_text = TEXT_CACHE.render(f"Current: {note_names[current_note]}", 24, (100, 100, 100))
+            layers.append(blit_layer('debug', current_note, debug_text, (40, 90)))
+        feedback_left = feedback_until - timestep.time if feedback else 0.0
+        if feedback_left > 0:
             feedback_rect = feedback.get_rect(center=(WIDTH // 2, HEIGHT - 40))
-            screen.blit(feedback, feedback_rect)
-        # 更新和绘制烟花
-        for firework in fireworks:
-            firework.update()
-            firework.draw(screen)
-        fireworks = [fw for fw in fireworks if not fw.is_finished()]
-        pygame.display.flip()
-        clock.tick(60)
-
-# --- 低音谱号识别功能（main_bass.py核心） ---
-def run_bass():
-    STAFF_X = 120
-    STAFF_W = 660
-    LINE_SPACING = 32
-    STAFF_LINES = 5
-    STAFF_TOP = 220
-    STAFF_BOTTOM = STAFF_TOP + (STAFF_LINES - 1) * LINE_SPACING
-    def line_y(line_idx):
-        return STAFF_BOTTOM - line_idx * LINE_SPACING
-    def space_y(below_line_idx):
-        return (line_y(below_line_idx) + line_y(below_line_idx+1)) / 2
-    
-    # 低音谱号标准音符位置
-    # 从下到上：第1线=G2, 第2线=B2, 第3线=D3, 第4线=F3, 第5线=A3
-    note_names = ['E2', 'F2', 'G2', 'A2', 'B2', 'C3', 'D3', 'E3', 'F3', 'G3', 'A3', 'B3', 'C4']
-    note_positions = [
-        line_y(0) + LINE_SPACING,     # E2 下加一线
-        space_y(-1) + LINE_SPACING,   # F2 下加一间（第1线下方的间）
-        line_y(0),                    # G2 第1线
-        space_y(0),                   # A2 第1间
-        line_y(1),                    # B2 第2线
-        space_y(1),                   # C3 第2间
-        line_y(2),                    # D3 第3线
-        space_y(2),                   # E3 第3间
-        line_y(3),                    # F3 第4线
-        space_y(3),                   # G3 第4间
-        line_y(4),                    # A3 第5线
-        space_y(4),                   # B3 第5线上方的间
-        line_y(4) - LINE_SPACING      # C4 上加一线
-    ]
-    score = 0
-    current_note = random.randint(0, len(note_names)-1)
-    running = True
+            layers.append(blit_layer('feedback', (feedback_until, feedback), feedback, feedback_rect.topleft))
+        animating = not fireworks.is_finished() or PROFILER.overlay_visible
+        if not fireworks.is_finished():
+            layers.append(fireworks_layer(fireworks))
+        if PROFILER.overlay_visible:
+            layers.append(profiler_layer())
+        PROFILER.mark('update')
+        # 只重画并提交变化的区域
+        dirty = renderer.render(screen, layers)
+        PROFILER.mark('draw')
+        if dirty:
+            pygame.display.update(dirty)
+        PROFILER.mark('present')
+        if animating:
+            wait_ms = None
+        else:
+            # 没有动画：等到下一个输入、提示该消失或音序需要续块时再醒来
+            wait_ms = IDLE_TIMEOUT_MS
+            if feedback_left > 0:
+                wait_ms = min(wait_ms, math.ceil(feedback_left * 1000))
+            if SEQUENCE_PLAYER.is_playing():
+                wait_ms = min(wait_ms, int(SEQUENCE_PLAYER.chunk_seconds * 500))
+        clock.tick(GAME_FPS if animating else 0)
+        PROFILER.mark('tick')
+        PROFILER.end_frame()
+
+# --- 视奏模式 ---
+# 一串音符从右向左连续滚过五线谱，按 1-7 依次识读经过判定线的音符，来不及作答的音符算漏过。
+# 符头连同加线按谱号、音高和状态预先栅格化成带透明色键的小图，所有可见音符每帧只用一次 Surface.blits 画出；
+# 时间轴、判分和计分由 quiz_session.SightReadingSession 负责：时间轴按横坐标有序，用二分查找取出落在
+# 五线谱内的下标区间，区间外的音符不参与绘制。
+SIGHT_SPACING = 64        # 相邻音符的基本间距（像素），实际间距为其 quiz_session.SIGHT_GAPS 倍
+SIGHT_SPEED = 90          # 滚动速度（像素/秒）
+SIGHT_HIT_OFFSET = 80     # 判定线距五线谱左端的距离
+SIGHT_MISS_PX = 24        # 越过判定线这么远仍未作答即算漏过
+SIGHT_COLORKEY = (255, 0, 255)
+# 各音符状态（quiz_session.SIGHT_PENDING/TARGET/CORRECT/WRONG）的颜色
+SIGHT_COLORS = (BLACK, BLUE, (0, 170, 0), RED)
+
+def note_sprite_rect(clef, index):
+    """符头及加线的包围矩形：横坐标相对符头中心，纵坐标为屏幕坐标"""
+    y = clef.note_ys[index]
+    ledger_ys = clef.ledger_ys[index]
+    top = min([y - clef.head_radius] + [ly - 1 for ly in ledger_ys])
+    bottom = max([y + clef.head_radius] + [ly + 1 for ly in ledger_ys])
+    half = max(clef.head_radius, clef.ledger_half_width)
+    return pygame.Rect(-half, top, half * 2 + 1, bottom - top + 1)
+
+def build_note_sprite(clef, index, color):
+    """把一个符头（空心圆）及其加线画到带色键的小图上；RLE 加速后 blit 只复制不透明的像素"""
+    rect = note_sprite_rect(clef, index)
+    sprite = pygame.Surface(rect.size).convert()
+    sprite.fill(SIGHT_COLORKEY)
+    x, y = -rect.x, clef.note_ys[index] - rect.y
+    pygame.draw.circle(sprite, color, (x, y), clef.head_radius)
+    pygame.draw.circle(sprite, WHITE, (x, y), clef.head_hole)
+    for ly in clef.ledger_ys[index]:
+        ly -= rect.y
+        pygame.draw.line(sprite, color, (x - clef.ledger_half_width, ly), (x + clef.ledger_half_width, ly), 2)
+    sprite.set_colorkey(SIGHT_COLORKEY, pygame.RLEACCEL)
+    return sprite
+
+def note_sprites(clef):
+    """某个谱号的全部符头小图：sprites[状态][音符下标]"""
+    return [[ASSET_CACHE.get_or_build(('<note-sprite>', clef.name, clef.head_radius, index, color),
+                                      lambda index=index, color=color: build_note_sprite(clef, index, color))
+             for index in range(len(clef.note_names))]
+            for color in SIGHT_COLORS]
+
+def build_sight_background(clef):
+    """五线谱背景加上一条竖直的判定线"""
+    background = clef.build_background()
+    hit_x = clef.staff_x + SIGHT_HIT_OFFSET
+    pygame.draw.line(background, (170, 190, 235), (hit_x, clef.line_ys[4] - 2 * clef.line_spacing),
+                     (hit_x, clef.line_ys[0] + 2 * clef.line_spacing), 3)
+    return background
+
+def run_sight_reading(clef, spacing=SIGHT_SPACING, speed=SIGHT_SPEED, scheduler=None, start=None):
+    """视奏练习循环；start 为第一个音符距五线谱左端的距离（默认从右端进入）。返回会话（基准测试从中读取同屏音符数）"""
+    note_names = clef.note_names
+    SOUND_BANK.prewarm(note_names)
+    if scheduler is None:
+        scheduler = clef_scheduler(clef)
+    left, width = clef.staff_x, clef.staff_w
+    half = max(clef.head_radius, clef.ledger_half_width)
+    # 时间轴、判分和计分由 quiz_session 的状态机负责，这里只管显示、声音和输入
+    session = SightReadingSession(clef.pool, scheduler, width, speed, SIGHT_HIT_OFFSET - SIGHT_MISS_PX,
+                                  spacing, start=start)
+    sprites = note_sprites(clef)
+    extents = [note_sprite_rect(clef, index) for index in range(len(note_names))]
+    tops = [rect.y for rect in extents]
+    # 只画符头中心在五线谱两端之间的音符，图层两侧各留出半个符头（或加线）宽
+    top = min(tops)
+    notes_rect = pygame.Rect(left - half, top, width + half * 2 + 1, max(rect.bottom for rect in extents) - top)
     feedback = None
-    feedback_time = 0
-    fireworks = []  # 烟花列表
-    last_firework_score = 0  # 上次触发烟花的分数
-    # 不自动播放初始音符，等待用户交互
-    # 低音谱号图片
-    # 使用 assets 路径并兼容 PyInstaller
-    assets_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
-    clef_img_path = resource_path(os.path.join(assets_dir, 'f-clef.png'))
-    clef_img = None
-    if os.path.exists(clef_img_path):
-        try:
-            clef_img = pygame.image.load(clef_img_path).convert_alpha()
-            # 只保留黑色像素
-            for x in range(clef_img.get_width()):
-                for y in range(clef_img.get_height()):
-                    r, g, b, a = clef_img.get_at((x, y))
-                    if r < 40 and g < 40 and b < 40:
-                        clef_img.set_at((x, y), (0, 0, 0, a))
+    feedback_until = 0.0
+    fireworks = ParticlePool()
+    timestep = FixedTimestep()
+    renderer = DirtyRenderer(ASSET_CACHE.get_or_build(('<sight-staff>', clef.name, (WIDTH, HEIGHT)),
+                                                      lambda: build_sight_background(clef)))
+    while True:
+        events = AUDIO.poll_events()
+        PROFILER.mark('tick')
+        timestep.advance(None if fireworks.is_finished() else fireworks.update)
+        PROFILER.mark('update')   # 烟花模拟计入 update 阶段（mark 按阶段累加）
+        # 越过判定线仍未作答的音符算漏过
+        session.advance(timestep.time)
+        for event in events:
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                SEQUENCE_PLAYER.stop()
+                return session
+            elif event.type in EXPOSE_EVENTS:
+                renderer.invalidate()
+            elif event.type == pygame.KEYDOWN:
+                if event.key == PROFILE_HOTKEY:
+                    PROFILER.toggle_overlay()
+                if pygame.K_1 <= event.key <= pygame.K_7:
+                    # 目标音符还没进入五线谱时不能作答
+                    result = session.answer(event.key - pygame.K_1, timestep.time)
+                    if result is None:
+                        continue
+                    SOUND_BANK.play(note_names[result.note])
+                    if result.correct:
+                        feedback = TEXT_CACHE.render("Correct!", clef.text_size, clef.correct_color)
+                        if result.fireworks:
+                            for _ in range(3):
+                                fireworks.burst(random.randint(200, WIDTH - 200), random.randint(150, 350))
                     else:
-                        clef_img.set_at((x, y), (r, g, b, 0))
-            # 缩放为240像素高
-            scale_height = 240
-            scale_width = int(clef_img.get_width() * (scale_height / clef_img.get_height()))
-            clef_img = pygame.transform.smoothscale(clef_img, (scale_width, scale_height))
-        except Exception as e:
-            print(f"Failed to load clef image: {e}")
-    while running:
-        screen.fill(WHITE)
-        for i in range(STAFF_LINES):
-            y = line_y(i)
-            pygame.draw.line(screen, BLACK, (STAFF_X, y), (STAFF_X + STAFF_W, y), 2)
-        # 不显示谱号图片
-        note_x = STAFF_X + STAFF_W // 2
-        note_y = note_positions[current_note]
-        pygame.draw.circle(screen, BLACK, (note_x, int(note_y)), 14)
-        pygame.draw.circle(screen, WHITE, (note_x, int(note_y)), 10)
-        if note_names[current_note] == 'E2':
-            y = note_y
-            pygame.draw.line(screen, BLACK, (note_x-22, y), (note_x+22, y), 2)
-        if note_names[current_note] == 'C4':
-            y = note_y
-            pygame.draw.line(screen, BLACK, (note_x-22, y), (note_x+22, y), 2)
-        font2 = pygame.font.Font(None, 32)
-        text = font2.render(f"Score: {score} | Keys 1-7 = C~B | Current octave shown | Press SPACE to hear", True, BLACK)
-        screen.blit(text, (40, 20))
-        font3 = pygame.font.Font(None, 28)
-        info = font3.render("C=1  D=2  E=3  F=4  G=5  A=6  B=7", True, BLUE)
-        screen.blit(info, (40, 60))
-        # 显示当前音符名称（用于调试）
-        debug_font = pygame.font.Font(None, 24)
-        debug_text = debug_font.render(f"Current: {note_names[current_note]}", True, (100, 100, 100))
-        screen.blit(debug_text, (40, 90))
-        for event in pygame.event.get():
+                        feedback = TEXT_CACHE.render(clef.feedback_text(result.note), clef.text_size, RED)
+                    feedback_until = timestep.time + FEEDBACK_SECONDS
+        SEQUENCE_PLAYER.pump()
+        PROFILER.mark('events')
+        lo, hi = session.visible()
+        xs, notes, states = session.xs, session.notes, session.states
+        origin = left - half - session.scroll
+        batch = [(sprites[states[i]][notes[i]], (xs[i] + origin, tops[notes[i]])) for i in range(lo, hi)]
+        layers = [Layer('notes', (session.scroll, session.version), notes_rect,
+                        lambda target: target.blits(batch, doreturn=False))]
+        suffix = f" | Missed: {session.missed} | Keys 1-7 = C~B"
+        text = TEXT_CACHE.compose(score_parts(session.score, "Score: ", suffix), clef.text_size, BLACK)
+        layers.append(blit_layer('score', (session.score, session.missed), text, (40, 20)))
+        if feedback and feedback_until > timestep.time:
+            feedback_rect = feedback.get_rect(center=(WIDTH // 2, HEIGHT - 40))
+            layers.append(blit_layer('feedback', (feedback_until, feedback), feedback, feedback_rect.topleft))
+        if not fireworks.is_finished():
+            layers.append(fireworks_layer(fireworks))
+        if PROFILER.overlay_visible:
+            layers.append(profiler_layer())
+        PROFILER.mark('update')
+        dirty = renderer.render(screen, layers)
+        PROFILER.mark('draw')
+        if dirty:
+            pygame.display.update(dirty)
+        PROFILER.mark('present')
+        # 音符一直在滚动，始终按动画帧率运行
+        clock.tick(GAME_FPS)
+        PROFILER.mark('tick')
+        PROFILER.end_frame()
+
+# --- 音频诊断界面 ---
+def run_audio_diagnostics():
+    """显示混音器配置和按键到 play() 的延迟；按 1-7 播放 C4-B4 进行测量"""
+    test_notes = ['C4', 'D4', 'E4', 'F4', 'G4', 'A4', 'B4']
+    SOUND_BANK.prewarm(test_notes)
+    wait_ms = None  # 第一帧不等待；之后画面只在按键后变化
+    while True:
+        for event in AUDIO.poll_events(wait_ms):
             if event.type == pygame.QUIT:
                 return
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     return
-                # 按空格键播放当前音符
-                if event.key == pygame.K_SPACE:
-                    if note_names[current_note] in NOTE_SOUNDS:
-                        NOTE_SOUNDS[note_names[current_note]].play()
                 if pygame.K_1 <= event.key <= pygame.K_7:
-                    guess = event.key - pygame.K_1  # 0=C, 1=D, 2=E, 3=F, 4=G, 5=A, 6=B
-                    # 获取当前音符的字母名称（忽略八度）
-                    current_note_name = note_names[current_note]
-                    note_letter = current_note_name[0]  # 取第一个字符，如 'C3' -> 'C'
-                    
-                    # 将字母转换为数字 (C=0, D=1, E=2, F=3, G=4, A=5, B=6)
-                    note_to_num = {'C': 0, 'D': 1, 'E': 2, 'F': 3, 'G': 4, 'A': 5, 'B': 6}
-                    correct = note_to_num.get(note_letter, -1)
-                    
-                    if guess == correct:
-                        score += 1
-                        feedback = font2.render("Correct!", True, (0,180,0))
-                        feedback_time = pygame.time.get_ticks()
-                        # 答对后播放当前音符（反馈音）
-                        if note_names[current_note] in NOTE_SOUNDS:
-                            NOTE_SOUNDS[note_names[current_note]].play()
-                        current_note = random.randint(0, len(note_names)-1)
-                        # 每得10分触发烟花
-                        if score % 10 == 0 and score > last_firework_score:
-                            for _ in range(3):  # 同时发射3个烟花
-                                fw_x = random.randint(200, WIDTH - 200)
-                                fw_y = random.randint(150, 350)
-                                fireworks.append(Firework(fw_x, fw_y))
-                            last_firework_score = score
-                    else:
-                        # 答错后播放正确的音符（让用户听到正确答案）
-                        if note_names[current_note] in NOTE_SOUNDS:
-                            NOTE_SOUNDS[note_names[current_note]].play()
-                        feedback = font2.render(f"Wrong! {note_names[current_note]}", True, RED)
-                        feedback_time = pygame.time.get_ticks()
-        if feedback and pygame.time.get_ticks() - feedback_time < 1000:
-            feedback_rect = feedback.get_rect(center=(WIDTH // 2, HEIGHT - 40))
-            screen.blit(feedback, feedback_rect)
-        # 更新和绘制烟花
-        for firework in fireworks:
-            firework.update()
-            firework.draw(screen)
-        fireworks = [fw for fw in fireworks if not fw.is_finished()]
+                    SOUND_BANK.play(test_notes[event.key - pygame.K_1])
+        screen.fill(WHITE)
+        lines = ["Audio diagnostics"]
+        if AUDIO.available:
+            lines.append(f"Mixer: {AUDIO.sample_rate} Hz, {AUDIO.channels} ch, buffer {AUDIO.buffer} samples "
+                         f"({AUDIO.buffer_latency() * 1000:.1f} ms)")
+            lines.append(f"Reserved feedback channels: {len(AUDIO.feedback_channels)}")
+        else:
+            lines.append("Mixer not available")
+        stats = AUDIO.latency_stats()
+        if stats:
+            lines.append(f"Keypress -> play(): last {stats['last_ms']:.2f} ms, median {stats['median_ms']:.2f} ms, "
+                         f"max {stats['max_ms']:.2f} ms ({stats['samples']} presses)")
+            lines.append(f"Event queue wait (est.): {stats['queue_wait_ms']:.1f} ms")
+            lines.append(f"Estimated keypress -> speaker: {stats['estimated_total_ms']:.1f} ms")
+        else:
+            lines.append("No presses measured yet")
+        if MIC.worker is not None:
+            budget = MIC.worker.latency_budget(MIC.block)
+            lines.append(f"Pitch detection budget: {budget['total_ms']:.0f} ms (frame {budget['window_ms']:.0f} ms, "
+                         f"analysis max {budget['compute_max_ms']:.2f} ms, dropped {budget['dropped_blocks']})")
+        lines.append("Press 1-7 to play C4-B4, ESC to return")
+        for i, line in enumerate(lines):
+            screen.blit(TEXT_CACHE.render(line, 40 if i == 0 else 28, BLACK if i else BLUE), (40, 40 + i * 44))
         pygame.display.flip()
-        clock.tick(60)
+        wait_ms = IDLE_TIMEOUT_MS
+        clock.tick(MENU_FPS)
 
 # --- 主流程 ---
-while True:
-    mode = menu_loop()
-    if mode == 'treble':
-        run_treble()
-    elif mode == 'bass':
-        run_bass()
-    else:
-        break
-pygame.quit()
+def init(headless=False, sample_rate=22050, audio_buffer=512, audio_channels=1, use_pack=True):
+    """初始化 pygame、混音器和窗口；headless 模式使用 SDL 的 dummy 视频/音频驱动"""
+    global clock
+    if headless:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    AUDIO.sample_rate, AUDIO.buffer, AUDIO.channels = sample_rate, audio_buffer, audio_channels
+    AUDIO.pre_init()
+    pygame.init()
+    TEXT_CACHE.clear()
+    AUDIO.open()
+    SOUND_BANK.configure(AUDIO.sample_rate, AUDIO.channels)
+    set_display_mode((WIDTH, HEIGHT))
+    if use_pack:
+        load_asset_pack()
+    pygame.display.set_caption("Music Note Recognition Game")
+    clock = pygame.time.Clock()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Music Note Recognition Game")
+    parser.add_argument('--headless', action='store_true',
+                        help="run without a real window or audio device (SDL dummy drivers)")
+    parser.add_argument('--clef', choices=sorted(CLEFS),
+                        help="start directly in this practice mode instead of the menu")
+    parser.add_argument('--sight-reading', action='store_true',
+                        help="start directly in the scrolling sight-reading mode (clef from --clef, default treble)")
+    parser.add_argument('--sample-rate', type=int, default=22050, help="mixer sample rate in Hz")
+    parser.add_argument('--audio-buffer', type=int, default=512,
+                        help="mixer buffer size in samples; smaller means lower latency but risks dropouts")
+    parser.add_argument('--audio-channels', type=int, choices=[1, 2], default=1)
+    parser.add_argument('--profile', action='store_true',
+                        help="record per-phase frame timings and show the overlay (toggle with F3)")
+    parser.add_argument('--profile-csv', metavar='PATH',
+                        help="record per-phase frame timings and write every frame to this CSV file on exit")
+    parser.add_argument('--learner', default='default',
+                        help="name under which per-note statistics are saved between sessions")
+    parser.add_argument('--no-session-log', action='store_true',
+                        help="do not record practice sessions to ~/.music_note_game/logs")
+    parser.add_argument('--power-save', choices=['auto', 'on', 'off'], default='auto',
+                        help="halve the frame rate caps; 'auto' does so when running on battery")
+    parser.add_argument('--max-fps', type=int, metavar='N', help="never render more than N frames per second")
+    parser.add_argument('--no-asset-pack', action='store_true',
+                        help="ignore assets/assets.mngpack and decode/synthesize everything at runtime")
+    parser.add_argument('--mic', action='store_true',
+                        help="also accept answers sung or played into the microphone")
+    args = parser.parse_args(argv)
+    load_learner(args.learner)
+    configure_frame_rate(args.power_save, args.max_fps)
+    init(headless=args.headless, sample_rate=args.sample_rate, audio_buffer=args.audio_buffer,
+         audio_channels=args.audio_channels, use_pack=not args.no_asset_pack)
+    if args.profile or args.profile_csv:
+        PROFILER.enable(args.profile_csv)
+        PROFILER.overlay_visible = args.profile
+    if args.mic and not MIC.open(AUDIO.sample_rate):
+        print(f"Microphone input disabled: {MIC.error}")
+    mode = 'sight' if args.sight_reading else args.clef
+    while True:
+        if mode is None:
+            mode = menu_loop()
+        if mode == 'audio':
+            run_audio_diagnostics()
+        elif mode in CLEFS:
+            event_log = None if args.no_session_log else open_session_log(CLEFS[mode], args.learner)
+            MIC.listen(True)
+            run_clef(CLEFS[mode], event_log=event_log)
+            MIC.listen(False)
+            if event_log is not None:
+                event_log.close()
+            save_learner()
+        elif mode == 'sight':
+            MIC.listen(True)
+            run_sight_reading(CLEFS[args.clef or 'treble'])
+            MIC.listen(False)
+            save_learner()
+        else:
+            break
+        mode = None
+    MIC.close()
+    PROFILER.close()
+    pygame.quit()
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,7 @@ a = Analysis(
     ['music_note_game.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=[('assets', 'assets')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
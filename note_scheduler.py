@@ -0,0 +1,225 @@
+"""自适应的出题调度（不依赖 pygame）。
+
+每个音符记录错误率和反应时间（指数滑动平均），据此计算权重：常错、反应慢的音符出现得更多，
+已经熟练的音符逐渐少出。按权重抽样用树状数组（Fenwick tree）实现，抽样和更新都是 O(log n)，
+题库扩展到所有谱号 × 音高 × 升降号组合时依然很快。统计数据可保存为 JSON，在多次练习之间保留。
+
+直接运行本文件会执行一个抽样/更新的微基准：
+    python note_scheduler.py
+"""
+import json
+import os
+import random
+import time
+
+# 滑动平均的更新系数：越大越看重最近几次作答
+EWMA_ALPHA = 0.3
+# 新音符的先验错误率
+PRIOR_ERROR = 0.5
+# 反应时间达到该值（秒）视为“慢”，权重额外增加
+TARGET_RESPONSE_TIME = 2.0
+# 即使已经完全掌握，也保留一点出现概率
+MIN_WEIGHT = 0.05
+
+class FenwickTree:
+    """支持单点修改、前缀和以及按前缀和反查下标的树状数组（下标从 0 开始）"""
+    __slots__ = ('_values', '_tree')
+
+    def __init__(self, weights=()):
+        # O(n) 建树：每个节点把自己的和累加到父节点
+        self._values = [float(w) for w in weights]
+        self._tree = [0.0] + self._values
+        for i in range(1, len(self._tree)):
+            parent = i + (i & -i)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[i]
+
+    def __len__(self):
+        return len(self._values)
+
+    def append(self, weight):
+        """在末尾追加一个元素，O(log n)"""
+        i = len(self._values) + 1
+        # 新节点覆盖 (i - lowbit(i), i]，其中除了自身以外的部分由已有前缀和求出
+        node = weight + self.prefix_sum(i - 1) - self.prefix_sum(i - (i & -i))
+        self._tree.append(node)
+        self._values.append(weight)
+
+    def add(self, index, delta):
+        self._values[index] += delta
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def set(self, index, weight):
+        self.add(index, weight - self._values[index])
+
+    def get(self, index):
+        return self._values[index]
+
+    def prefix_sum(self, count):
+        """前 count 个元素之和"""
+        total = 0.0
+        while count > 0:
+            total += self._tree[count]
+            count -= count & -count
+        return total
+
+    def total(self):
+        return self.prefix_sum(len(self._values))
+
+    def find(self, target):
+        """返回最小的下标 i，使得前 i+1 个元素之和 > target"""
+        pos = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= target:
+                pos = nxt
+                target -= self._tree[nxt]
+            step >>= 1
+        return min(pos, len(self._values) - 1)
+
+class NoteStats:
+    __slots__ = ('attempts', 'errors', 'error_rate', 'response_time')
+
+    def __init__(self, attempts=0, errors=0, error_rate=PRIOR_ERROR, response_time=None):
+        self.attempts = attempts
+        self.errors = errors
+        self.error_rate = error_rate          # 错误率的滑动平均
+        self.response_time = response_time    # 反应时间的滑动平均（秒），尚未作答为 None
+
+    def record(self, correct, response_time=None):
+        self.attempts += 1
+        if not correct:
+            self.errors += 1
+        self.error_rate += EWMA_ALPHA * ((0.0 if correct else 1.0) - self.error_rate)
+        if response_time is not None:
+            if self.response_time is None:
+                self.response_time = response_time
+            else:
+                self.response_time += EWMA_ALPHA * (response_time - self.response_time)
+
+    def weight(self):
+        slowness = 0.0
+        if self.response_time is not None:
+            slowness = 0.25 * min(self.response_time / TARGET_RESPONSE_TIME, 2.0)
+        return MIN_WEIGHT + self.error_rate + slowness
+
+    def to_list(self):
+        return [self.attempts, self.errors, self.error_rate, self.response_time]
+
+class NoteScheduler:
+    """一个题库（例如一个谱号的全部音符）的加权抽样器；测验服务器为每个会话建一个，所以用 __slots__"""
+    __slots__ = ('rng', 'notes', 'stats', '_index', '_tree', 'last')
+
+    def __init__(self, notes=(), rng=None, stats=None):
+        self.rng = rng or random.Random()
+        self.notes = list(dict.fromkeys(notes))
+        self.stats = list(stats) if stats is not None else [NoteStats() for _ in self.notes]
+        self._index = {note: i for i, note in enumerate(self.notes)}
+        self._tree = FenwickTree([s.weight() for s in self.stats])
+        self.last = None
+
+    def __len__(self):
+        return len(self.notes)
+
+    def __contains__(self, note):
+        return note in self._index
+
+    def add(self, note, stats=None):
+        """加入一个音符（已存在则忽略），返回其下标"""
+        if note in self._index:
+            return self._index[note]
+        stats = stats or NoteStats()
+        self._index[note] = len(self.notes)
+        self.notes.append(note)
+        self.stats.append(stats)
+        self._tree.append(stats.weight())
+        return self._index[note]
+
+    def next(self, avoid_repeat=True):
+        """按权重抽取下一个音符；默认不连续出同一个音符"""
+        skip = self._index.get(self.last) if avoid_repeat and len(self.notes) > 1 else None
+        if skip is not None:
+            saved = self._tree.get(skip)
+            self._tree.set(skip, 0.0)
+        index = self._tree.find(self.rng.random() * self._tree.total())
+        if skip is not None:
+            self._tree.set(skip, saved)
+        self.last = self.notes[index]
+        return self.last
+
+    def record(self, note, correct, response_time=None):
+        index = self.add(note)
+        stats = self.stats[index]
+        stats.record(correct, response_time)
+        self._tree.set(index, stats.weight())
+
+    def stats_for(self, note):
+        """某个音符的统计；不在题库中时返回 None"""
+        index = self._index.get(note)
+        return None if index is None else self.stats[index]
+
+    def weight(self, note):
+        return self._tree.get(self._index[note])
+
+    def to_dict(self):
+        return {note: stats.to_list() for note, stats in zip(self.notes, self.stats)}
+
+    @classmethod
+    def from_dict(cls, data, rng=None):
+        return cls(list(data), rng, [NoteStats(*values) for values in data.values()])
+
+# --- 持久化 ---
+# 文件内容：{"version": 1, "pools": {题库名: {音符: [作答次数, 错误次数, 错误率, 反应时间]}}}
+STATS_VERSION = 1
+
+def load_schedulers(path, rng=None):
+    """读取某个学习者的全部题库；文件不存在或损坏时返回空字典"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get('version') != STATS_VERSION:
+        return {}
+    pools = data.get('pools', {})
+    if not isinstance(pools, dict):
+        return {}
+    try:
+        return {name: NoteScheduler.from_dict(pool, rng) for name, pool in pools.items()}
+    except (TypeError, AttributeError, ValueError):
+        # 结构合法的 JSON 但内容不对（例如统计值不是列表），当作损坏的文件
+        return {}
+
+def save_schedulers(path, schedulers):
+    """先写临时文件再替换，避免中途退出时把统计文件写坏"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    data = {'version': STATS_VERSION,
+            'pools': {name: scheduler.to_dict() for name, scheduler in schedulers.items()}}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+# --- 微基准 ---
+def benchmark(pool_size=100000, draws=100000, seed=0):
+    """在 pool_size 个音符的题库上交替抽样和记录作答，返回每次 (抽样 + 更新) 的平均耗时（秒）"""
+    rng = random.Random(seed)
+    letters = 'CDEFGAB'
+    notes = [f"clef{i % 7}:{letters[i % 7]}{'#b'[i % 2]}{i}" for i in range(pool_size)]
+    start = time.perf_counter()
+    scheduler = NoteScheduler(notes, rng)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(draws):
+        note = scheduler.next()
+        scheduler.record(note, rng.random() < 0.7, rng.uniform(0.5, 4.0))
+    return build, (time.perf_counter() - start) / draws
+
+if __name__ == '__main__':
+    for size in (100, 10000, 1000000):
+        build, per_draw = benchmark(size, draws=20000)
+        print(f"pool {size:>8}: build {build * 1000:8.1f} ms, next + record {per_draw * 1e6:6.1f} us")
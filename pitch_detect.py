@@ -0,0 +1,388 @@
+"""实时音高检测（不依赖 pygame），让学生可以唱出或弹出答案。
+
+音频按固定长度的帧分析（22050 Hz 时默认每帧 1024 个采样，每 256 个采样分析一次），用 YIN 算法估计基频：
+差函数 d(τ) 由 FFT 求出的互相关和能量前缀和组合而成，整帧向量化计算。所有中间数组在构造时分配、逐帧复用；
+numpy 的 FFT 支持 out 参数时（numpy >= 2.0）连频谱也写入预分配的数组，否则只有这两个数组每帧新建
+（pocketfft 内部的临时工作区不在此列）。
+检测结果换算成 NOTE_FREQUENCIES 中最近的音名和音分偏差。
+
+PitchStream 是同步的流式接口：feed() 任意长度的采样，每凑够一跳就输出一个检测结果，离线（WAV 文件、合成音）
+和实时采集共用同一套代码。PitchWorker 把它放到后台线程：submit() 从不阻塞（队列满了就丢弃并计数），
+所以渲染循环不会被分析拖慢。
+
+直接运行本文件可以离线检测 WAV 文件或合成音，输出 JSON 报告（识别出的音符、实测检测延迟和延迟预算）：
+    python pitch_detect.py --tone A4 --tone E2
+    python pitch_detect.py recording.wav
+"""
+import argparse
+import bisect
+import json
+import math
+import queue
+import sys
+import threading
+import time
+import wave
+from collections import deque, namedtuple
+
+import numpy as np
+
+from tone_synth import NOTE_FREQUENCIES, TIMBRES, note_frequency, synthesize_tone
+
+# YIN 的累积均值归一化差函数低于该阈值即认为找到周期
+YIN_THRESHOLD = 0.15
+# 帧的均方根低于该值（满幅为 1）视为静音
+MIN_RMS = 0.01
+# 与最近音符相差超过这么多音分时不认作任何音符
+MAX_CENTS = 50.0
+# 连续这么多帧检测到同一个音符才算唱出/弹出了这个音
+HOLD_FRAMES = 3
+
+Detection = namedtuple('Detection', 'time frequency note cents confidence')
+
+def _fft_supports_out():
+    try:
+        np.fft.rfft(np.zeros(4), out=np.zeros(3, dtype=complex))
+    except TypeError:
+        return False
+    return True
+
+_FFT_OUT = _fft_supports_out()
+
+class YinDetector:
+    """对固定长度的帧做 YIN 基频估计；analyze() 不分配新数组（见模块说明）"""
+
+    def __init__(self, sample_rate=22050, frame_size=1024, fmin=60.0, fmax=1100.0, threshold=YIN_THRESHOLD):
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.threshold = threshold
+        self.window = frame_size // 2                        # 积分窗口 W，可检测的周期 τ < W
+        self.tau_min = max(2, int(sample_rate / fmax))
+        self.tau_max = min(self.window - 1, int(math.ceil(sample_rate / fmin)))
+        if self.tau_min >= self.tau_max:
+            raise ValueError(f"frame_size {frame_size} is too short for fmin {fmin} Hz at {sample_rate} Hz")
+        n_fft = 1 << (frame_size + self.window - 1).bit_length()  # 足够长，互相关不会绕回
+        self._n_fft = n_fft
+        self._padded = np.zeros(n_fft)           # 整帧（补零）
+        self._head = np.zeros(n_fft)             # 前 W 个采样（补零）
+        self._spectrum = np.zeros(n_fft // 2 + 1, dtype=complex)
+        self._head_spectrum = np.zeros(n_fft // 2 + 1, dtype=complex)
+        self._correlation = np.zeros(n_fft)
+        self._squares = np.zeros(frame_size)
+        self._energy_sums = np.zeros(frame_size + 1)   # 平方和的前缀和
+        self._diff = np.zeros(self.window)              # d(τ)
+        self._diff_sums = np.zeros(self.window)
+        self._cmnd = np.zeros(self.window)              # 累积均值归一化差函数 d'(τ)
+        self._taus = np.arange(self.window, dtype=float)
+        self._below = np.zeros(self.tau_max - self.tau_min, dtype=bool)
+
+    def _rfft(self, signal, out):
+        if _FFT_OUT:
+            np.fft.rfft(signal, out=out)
+        else:
+            out[:] = np.fft.rfft(signal)
+
+    def _irfft(self, spectrum, out):
+        if _FFT_OUT:
+            np.fft.irfft(spectrum, self._n_fft, out=out)
+        else:
+            out[:] = np.fft.irfft(spectrum, self._n_fft)
+
+    def analyze(self, frame, min_rms=MIN_RMS):
+        """frame 为 frame_size 个 [-1, 1] 的采样；返回 (频率 Hz, 置信度)，静音或无明显周期时频率为 0"""
+        n, w = self.frame_size, self.window
+        np.multiply(frame, frame, out=self._squares)
+        np.cumsum(self._squares, out=self._energy_sums[1:])
+        if self._energy_sums[n] < n * min_rms * min_rms:
+            return 0.0, 0.0
+        # 互相关 r(τ) = Σ_{j<W} x_j x_{j+τ}
+        self._padded[:n] = frame
+        self._head[:w] = frame[:w]
+        self._rfft(self._padded, self._spectrum)
+        self._rfft(self._head, self._head_spectrum)
+        np.conjugate(self._head_spectrum, out=self._head_spectrum)
+        self._spectrum *= self._head_spectrum
+        self._irfft(self._spectrum, self._correlation)
+        # d(τ) = Σ x_j² + Σ x_{j+τ}² - 2 r(τ)，两个平方和都由前缀和相减得到
+        diff = self._diff
+        np.subtract(self._energy_sums[w:2 * w], self._energy_sums[:w], out=diff)
+        diff += self._energy_sums[w]
+        diff -= self._correlation[:w]
+        diff -= self._correlation[:w]
+        np.maximum(diff, 0.0, out=diff)
+        # d'(τ) = d(τ) · τ / Σ_{k=1..τ} d(k)，d'(0) = 1
+        np.cumsum(diff, out=self._diff_sums)
+        self._diff_sums += 1e-12
+        cmnd = self._cmnd
+        np.multiply(diff, self._taus, out=cmnd)
+        cmnd /= self._diff_sums
+        cmnd[0] = 1.0
+        # 在允许的周期范围内找第一个低于阈值的谷，再走到这个谷的最低点
+        np.less(cmnd[self.tau_min:self.tau_max], self.threshold, out=self._below)
+        first = int(self._below.argmax())
+        if not self._below[first]:
+            return 0.0, 0.0
+        tau = self.tau_min + first
+        while tau + 1 < self.tau_max and cmnd[tau + 1] < cmnd[tau]:
+            tau += 1
+        # 抛物线插值得到亚采样精度的周期
+        a, b, c = cmnd[tau - 1], cmnd[tau], cmnd[tau + 1]
+        denominator = a - 2 * b + c
+        shift = 0.5 * (a - c) / denominator if denominator > 0 else 0.0
+        return self.sample_rate / (tau + shift), float(1.0 - b)
+
+class NoteTable:
+    """频率 -> 最近的音名及音分偏差"""
+
+    def __init__(self, notes=NOTE_FREQUENCIES, max_cents=MAX_CENTS):
+        pairs = sorted((freq, note) for note, freq in notes.items())
+        self.names = [note for _, note in pairs]
+        self.log_freqs = [math.log2(freq) for freq, _ in pairs]
+        self.max_cents = max_cents
+
+    def nearest(self, frequency):
+        """返回 (音名, 音分)；偏差超过 max_cents 时音名为 None"""
+        if frequency <= 0:
+            return None, 0.0
+        target = math.log2(frequency)
+        i = bisect.bisect_left(self.log_freqs, target)
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(self.names)]
+        best = min(candidates, key=lambda j: abs(self.log_freqs[j] - target))
+        cents = 1200.0 * (target - self.log_freqs[best])
+        return (self.names[best] if abs(cents) <= self.max_cents else None), cents
+
+class NoteTracker:
+    """把逐帧的检测结果变成“唱出了一个音”的事件：同一音符连续 hold 帧才触发，持续的长音只触发一次"""
+
+    def __init__(self, hold=HOLD_FRAMES):
+        self.hold = hold
+        self._note = None
+        self._count = 0
+
+    def update(self, detection):
+        """返回新触发的音名，没有则返回 None"""
+        if detection.note != self._note:
+            self._note = detection.note
+            self._count = 0
+        if self._note is None:
+            return None
+        self._count += 1
+        return self._note if self._count == self.hold else None
+
+    def reset(self):
+        self._note = None
+        self._count = 0
+
+class PitchStream:
+    """流式检测：采样先写入一帧长的滑动缓冲区，每凑够 hop 个新采样分析一次"""
+
+    def __init__(self, sample_rate=22050, frame_size=None, hop=None, fmin=60.0, fmax=1100.0,
+                 threshold=YIN_THRESHOLD, min_rms=MIN_RMS, notes=NOTE_FREQUENCIES, max_cents=MAX_CENTS,
+                 history=256):
+        # 默认帧长取能容纳两个 fmin 周期的最小 2 的幂（22050 Hz 时为 1024），每 1/4 帧分析一次
+        frame_size = frame_size or 1 << (2 * int(math.ceil(sample_rate / fmin))).bit_length()
+        hop = hop or frame_size // 4
+        if not 0 < hop <= frame_size:
+            raise ValueError("hop must be between 1 and frame_size")
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.hop = hop
+        self.min_rms = min_rms
+        self.detector = YinDetector(sample_rate, frame_size, fmin, fmax, threshold)
+        self.notes = NoteTable(notes, max_cents)
+        self.position = 0                          # 已送入的采样数
+        self.compute_times = deque(maxlen=history)  # 每帧分析耗时（秒）
+        self._frame = np.zeros(frame_size)
+        self._fill = 0
+
+    def reset(self):
+        self.position = 0
+        self._fill = 0
+
+    def feed(self, samples):
+        """送入一段采样：int16，或 [-1, 1] 的浮点；二维 (采样数, 声道) 时取各声道平均。返回新的检测结果列表"""
+        samples = np.asarray(samples)
+        scale = 1.0 / 32768 if samples.dtype == np.int16 else 1.0
+        results = []
+        pos, total = 0, len(samples)
+        while pos < total:
+            take = min(total - pos, self.frame_size - self._fill)
+            target = self._frame[self._fill:self._fill + take]
+            part = samples[pos:pos + take]
+            if part.ndim == 2:
+                np.mean(part, axis=1, out=target)
+                target *= scale
+            else:
+                np.multiply(part, scale, out=target)
+            self._fill += take
+            pos += take
+            self.position += take
+            if self._fill == self.frame_size:
+                results.append(self._analyze())
+                # 滑动一跳，保留后面 frame_size - hop 个采样
+                self._frame[:-self.hop] = self._frame[self.hop:]
+                self._fill = self.frame_size - self.hop
+        return results
+
+    def _analyze(self):
+        start = time.perf_counter()
+        frequency, confidence = self.detector.analyze(self._frame, self.min_rms)
+        note, cents = self.notes.nearest(frequency)
+        self.compute_times.append(time.perf_counter() - start)
+        return Detection(self.position / self.sample_rate, frequency, note, cents, confidence)
+
+    def latency_budget(self, input_block=0, hold=HOLD_FRAMES):
+        """从开始唱到确认音符的延迟预算（毫秒）。input_block 为采集设备每次回调的采样数"""
+        ms = 1000.0 / self.sample_rate
+        compute = sorted(self.compute_times) or [0.0]
+        budget = {
+            'input_block_ms': input_block * ms,
+            'window_ms': self.frame_size * ms,        # 新的音要占满一帧才能稳定地检测出来
+            'hop_ms': self.hop * ms,                  # 最坏情况下还要等一跳才轮到分析
+            'hold_ms': (hold - 1) * self.hop * ms,    # NoteTracker 要求连续 hold 帧
+            'compute_p50_ms': compute[len(compute) // 2] * 1000,
+            'compute_max_ms': compute[-1] * 1000,
+        }
+        budget['total_ms'] = (budget['input_block_ms'] + budget['window_ms'] + budget['hop_ms']
+                              + budget['hold_ms'] + budget['compute_max_ms'])
+        return budget
+
+class PitchWorker:
+    """在后台线程里运行 PitchStream；on_detection/on_note 回调也在该线程中调用"""
+
+    def __init__(self, stream, on_note=None, on_detection=None, hold=HOLD_FRAMES, max_pending=64, history=256):
+        self.stream = stream
+        self.on_note = on_note
+        self.on_detection = on_detection
+        self.tracker = NoteTracker(hold)
+        self.dropped = 0
+        self.detections = deque(maxlen=history)   # 最近的检测结果，供界面显示
+        self.queue_waits = deque(maxlen=history)  # 从 submit 到分析完成的耗时（秒）
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, samples, wait=False):
+        """交给后台线程分析；调用方之后不能再修改 samples。
+
+        队列满时丢弃并计数，绝不阻塞；离线分析（没有实时性要求）时可以传 wait=True 等待队列空出位置。
+        """
+        try:
+            self._queue.put((time.perf_counter(), samples), block=wait)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            submitted, samples = item
+            for detection in self.stream.feed(samples):
+                self.detections.append(detection)
+                if self.on_detection is not None:
+                    self.on_detection(detection)
+                note = self.tracker.update(detection)
+                if note is not None and self.on_note is not None:
+                    self.on_note(note)
+            self.queue_waits.append(time.perf_counter() - submitted)
+
+    def latency_budget(self, input_block=0):
+        budget = self.stream.latency_budget(input_block, self.tracker.hold)
+        waits = sorted(self.queue_waits) or [0.0]
+        budget['queue_max_ms'] = waits[-1] * 1000
+        budget['total_ms'] += budget['queue_max_ms']
+        budget['dropped_blocks'] = self.dropped
+        return budget
+
+    def close(self):
+        """处理完队列中剩余的采样后结束线程"""
+        self._queue.put(None)
+        self._thread.join()
+
+# --- 离线检测 ---
+def read_wav(path):
+    """读取 16 位 PCM 的 WAV 文件，返回 (采样率, int16 数组)；多声道时数组形状为 (采样数, 声道)"""
+    with wave.open(path, 'rb') as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV files are supported")
+        channels, sample_rate = f.getnchannels(), f.getframerate()
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2').astype(np.int16)
+    if channels > 1:
+        samples = samples.reshape(-1, channels)
+    return sample_rate, samples
+
+def detect(samples, sample_rate, block=256, threaded=False, lead_in=0.0, **stream_options):
+    """按 block 个采样一块地送入流式接口（模拟实时采集），返回报告字典。
+
+    lead_in 为开头的静音秒数；给出时报告从声音开始到第一个确认音符的实测延迟。
+    """
+    stream = PitchStream(sample_rate, **stream_options)
+    notes = []
+    tracker = NoteTracker()
+    detections = []
+    worker = None
+    if threaded:
+        worker = PitchWorker(stream, on_note=lambda note: notes.append((stream.position, note)),
+                             on_detection=detections.append)
+    for start in range(0, len(samples), block):
+        chunk = samples[start:start + block]
+        if worker is not None:
+            worker.submit(chunk, wait=True)
+            continue
+        for detection in stream.feed(chunk):
+            detections.append(detection)
+            note = tracker.update(detection)
+            if note is not None:
+                notes.append((stream.position, note))
+    if worker is not None:
+        worker.close()
+        budget = worker.latency_budget(block)
+    else:
+        budget = stream.latency_budget(block)
+    voiced = [d.frequency for d in detections if d.frequency > 0]
+    report = {
+        'seconds': len(samples) / sample_rate,
+        'frames': len(detections),
+        'voiced_frames': len(voiced),
+        'median_hz': float(np.median(voiced)) if voiced else None,
+        'notes': [note for _, note in notes],
+        'latency_budget': budget,
+    }
+    if lead_in and notes:
+        report['measured_detection_ms'] = (notes[0][0] / sample_rate - lead_in) * 1000
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('wav', nargs='*', help="16-bit PCM WAV files to analyze")
+    parser.add_argument('--tone', action='append', default=[], metavar='NOTE',
+                        help="analyze a synthesized tone for this note, e.g. A4 (repeatable)")
+    parser.add_argument('--timbre', choices=sorted(TIMBRES), default='piano')
+    parser.add_argument('--sample-rate', type=int, default=22050, help="sample rate for synthesized tones")
+    parser.add_argument('--frame-size', type=int, help="samples per analysis frame (default: from the sample rate)")
+    parser.add_argument('--hop', type=int, help="samples between analyses (default: a quarter frame)")
+    parser.add_argument('--block', type=int, default=256,
+                        help="samples per simulated capture callback")
+    parser.add_argument('--threaded', action='store_true', help="analyze on the background worker thread")
+    args = parser.parse_args(argv)
+    if not args.wav and not args.tone:
+        parser.error("give at least one WAV file or --tone")
+    options = dict(frame_size=args.frame_size, hop=args.hop)
+    reports = {}
+    for path in args.wav:
+        sample_rate, samples = read_wav(path)
+        reports[path] = detect(samples, sample_rate, args.block, args.threaded, **options)
+    for note in args.tone:
+        # 前面留 0.2 秒静音，测量从起音到确认音符的实际延迟
+        lead_in = 0.2
+        tone = synthesize_tone(note_frequency(note), 0.8, args.sample_rate, TIMBRES[args.timbre], channels=1)
+        samples = np.concatenate([np.zeros(int(lead_in * args.sample_rate), dtype=np.int16), tone])
+        report = detect(samples, args.sample_rate, args.block, args.threaded, lead_in=lead_in, **options)
+        report['expected'] = note
+        reports[f"tone:{note}"] = report
+    print(json.dumps(reports, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""测验服务器（quiz_server）的压测客户端：模拟一整个班级同时答题，报告吞吐量和尾延迟（JSON）。
+
+先建立全部连接并各自 START 一个会话，所有会话都就绪后再同时开始作答；每次 ANSWER 从发出到收到回复的
+时间记为一次延迟。--spawn 会在子进程里启动服务器（端口由系统分配），否则连接已经在运行的服务器：
+
+    python quiz_load.py --spawn --sessions 2000 --answers 50
+    python quiz_load.py --port 8765 --sessions 500 --think-ms 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from quiz_server import raise_file_limit
+from quiz_session import CLEF_RANGES, NOTE_LETTERS
+
+def percentile(sorted_values, q):
+    # 与 benchmark.percentile 相同；不导入 benchmark，它在导入时会设置 SDL 环境变量
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+async def request(reader, writer, line):
+    writer.write(line)
+    await writer.drain()
+    reply = await reader.readline()
+    if not reply:
+        raise ConnectionError("server closed the connection")
+    if reply.startswith(b'ERR'):
+        raise RuntimeError(reply.decode('ascii', 'replace').strip())
+    return reply
+
+async def server_stats(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    reply = await request(reader, writer, b'STATS\n')
+    writer.close()
+    return json.loads(reply[len(b'STATS '):])
+
+async def student(host, port, clef, answers, accuracy, think, rng, go, latencies):
+    """一个学生：连上并开始会话后等待发令，然后按 accuracy 的正确率答 answers 题"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        note = (await request(reader, writer, f"START {clef}\n".encode('ascii'))).split()[1]
+        await go.wait()
+        if think:
+            # 有思考时间时把第一题随机错开，否则所有人会在发令时同时作答
+            await asyncio.sleep(rng.uniform(0, think))
+        for _ in range(answers):
+            letter = NOTE_LETTERS.index(chr(note[0])) if rng.random() < accuracy else rng.randrange(7)
+            start = time.perf_counter()
+            reply = await request(reader, writer, f"ANSWER {letter + 1}\n".encode('ascii'))
+            latencies.append(time.perf_counter() - start)
+            note = reply.split()[4]
+            if think:
+                await asyncio.sleep(rng.uniform(0.5, 1.5) * think)
+        await request(reader, writer, b'QUIT\n')
+    finally:
+        writer.close()
+
+async def run(host, port, sessions=1000, answers=20, accuracy=0.8, think=0.0, seed=0, connect_batch=500):
+    rng = random.Random(seed)
+    clefs = sorted(CLEF_RANGES)
+    idle = await server_stats(host, port)
+    go = asyncio.Event()
+    latencies = []
+    start = time.perf_counter()
+    tasks = []
+    for i in range(sessions):
+        tasks.append(asyncio.ensure_future(student(host, port, rng.choice(clefs), answers, accuracy, think,
+                                                   random.Random(rng.random()), go, latencies)))
+        # 分批建立连接，避免瞬间塞满服务器的监听队列
+        if (i + 1) % connect_batch == 0:
+            await asyncio.sleep(0.05)
+    # 等全部会话都开始后再发令
+    while True:
+        loaded = await server_stats(host, port)
+        if loaded['sessions_started'] - idle['sessions_started'] >= sessions or all(t.done() for t in tasks):
+            break
+        await asyncio.sleep(0.05)
+    connected = time.perf_counter()
+    go.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    finished = time.perf_counter()
+    final = await server_stats(host, port)
+    errors = [repr(r) for r in results if isinstance(r, BaseException)]
+    latencies.sort()
+    elapsed = finished - connected
+    report = {
+        'sessions': sessions,
+        'answers_per_session': answers,
+        'think_ms': think * 1000,
+        'connect_s': connected - start,
+        'answer_phase_s': elapsed,
+        'requests': len(latencies),
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000,
+            'p95': percentile(latencies, 95) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'p999': percentile(latencies, 99.9) * 1000,
+            'max': (latencies[-1] if latencies else 0.0) * 1000,
+        },
+        'errors': len(errors),
+        'first_errors': errors[:5],
+        'server': {
+            'max_rss_kb_idle': idle['max_rss_kb'],
+            'max_rss_kb_loaded': loaded['max_rss_kb'],
+            'max_rss_kb_final': final['max_rss_kb'],
+        },
+    }
+    if idle['max_rss_kb'] is not None and sessions:
+        # 峰值 RSS 的增量摊到每个连接（含 asyncio 的流缓冲区），只是粗略估计
+        report['server']['kb_per_session'] = (loaded['max_rss_kb'] - idle['max_rss_kb']) / sessions
+    return report
+
+def spawn_server(seed=None):
+    """在子进程中启动 quiz_server，返回 (进程, 端口)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, os.path.join(here, 'quiz_server.py'), '--port', '0']
+    if seed is not None:
+        command += ['--seed', str(seed)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('listening on '):
+        process.kill()
+        raise RuntimeError(f"quiz_server did not start: {line!r}")
+    return process, int(line.rsplit(':', 1)[1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--spawn', action='store_true', help="start a quiz_server subprocess on a free port")
+    parser.add_argument('--sessions', type=int, default=1000, help="concurrent sessions (one connection each)")
+    parser.add_argument('--answers', type=int, default=20, help="answers per session")
+    parser.add_argument('--accuracy', type=float, default=0.8, help="fraction of correct answers")
+    parser.add_argument('--think-ms', type=float, default=0.0,
+                        help="average pause between a reply and the next answer (0 = flat out)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+    raise_file_limit()
+    process = None
+    port = args.port
+    if args.spawn:
+        process, port = spawn_server(args.seed)
+    try:
+        report = asyncio.run(run(args.host, port, args.sessions, args.answers, args.accuracy,
+                                 args.think_ms / 1000, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 1 if report['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
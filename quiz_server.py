@@ -0,0 +1,150 @@
+"""多会话的音符测验服务器（asyncio，不依赖 pygame），一台机器给整个班级出题。
+
+每个 TCP 连接对应一个练习会话（quiz_session.QuizSession + 独立的 NoteScheduler）。各谱号的题目和随机数生成器
+由所有会话共享，会话对象都用 __slots__，单个会话只占几 KB，可以同时挂上千个连接。
+
+协议为按行的 ASCII 文本，每条请求对应一行回复：
+    START <clef>       -> NOTE <音符>                                  开始（或重新开始）一个会话
+    ANSWER <1-7>       -> RESULT <答对 0/1> <分数> <烟花 0/1> <下一题>   1-7 对应 C-B
+    STATS              -> STATS <JSON>                                 服务器统计
+    QUIT               -> BYE                                          随后关闭连接
+出错时回复 ERR <说明>，连接保持打开；单行超过 StreamReader 的长度上限（64 KiB）时回复 ERR 后关闭连接。
+
+    python quiz_server.py --port 8765
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from note_scheduler import NoteScheduler
+from quiz_session import QuizSession, clef_pools
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+def raise_file_limit():
+    """把可打开的文件数（即连接数）软上限提到硬上限"""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+def max_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+class QuizServer:
+    def __init__(self, rng=None):
+        self.pools = clef_pools()
+        self.rng = rng or random.Random()
+        self.active = 0
+        self.sessions_started = 0
+        self.answers = 0
+        self.started = time.perf_counter()
+
+    def stats(self):
+        uptime = time.perf_counter() - self.started
+        return {
+            'active_sessions': self.active,
+            'sessions_started': self.sessions_started,
+            'answers': self.answers,
+            'uptime_s': uptime,
+            'answers_per_s': self.answers / uptime if uptime else 0.0,
+            'max_rss_kb': max_rss_kb(),
+        }
+
+    def dispatch(self, line, session):
+        """处理一行请求，返回 (回复, 会话)；回复为 None 表示客户端要求断开"""
+        parts = line.split()
+        if not parts:
+            return b'ERR empty request\n', session
+        command = parts[0].upper()
+        if command == b'ANSWER':
+            if session is None:
+                return b'ERR no session, send START first\n', session
+            if len(parts) != 2 or parts[1] not in (b'1', b'2', b'3', b'4', b'5', b'6', b'7'):
+                return b'ERR ANSWER takes a key from 1 to 7\n', session
+            result = session.answer(int(parts[1]) - 1, time.perf_counter())
+            self.answers += 1
+            reply = f"RESULT {int(result.correct)} {result.score} {int(result.fireworks)} {session.note}\n"
+            return reply.encode('ascii'), session
+        if command == b'START':
+            pool = self.pools.get(parts[1].decode('ascii', 'replace')) if len(parts) == 2 else None
+            if pool is None:
+                return f"ERR START takes one of: {' '.join(self.pools)}\n".encode('ascii'), session
+            session = QuizSession(pool, NoteScheduler(pool.notes, self.rng), time.perf_counter())
+            self.sessions_started += 1
+            return f"NOTE {session.note}\n".encode('ascii'), session
+        if command == b'STATS':
+            return f"STATS {json.dumps(self.stats())}\n".encode('ascii'), session
+        if command == b'QUIT':
+            return None, session
+        return b'ERR unknown command\n', session
+
+    async def handle(self, reader, writer):
+        self.active += 1
+        session = None
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    # 超长的一行无法跳过到下一个请求，只能断开
+                    writer.write(b'ERR request too long\n')
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                reply, session = self.dispatch(line, session)
+                if reply is None:
+                    writer.write(b'BYE\n')
+                    await writer.drain()
+                    break
+                writer.write(reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.active -= 1
+            writer.close()
+
+async def serve(host='127.0.0.1', port=8765, seed=None, ready=None):
+    """运行服务器直到被取消；ready(实际端口) 在开始监听后调用（port=0 时由系统分配端口）"""
+    raise_file_limit()
+    quiz = QuizServer(random.Random(seed))
+    server = await asyncio.start_server(quiz.handle, host, port, backlog=4096)
+    if ready is not None:
+        ready(server.sockets[0].getsockname()[1])
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help="TCP port (0 = pick a free one)")
+    parser.add_argument('--seed', type=int, help="seed the shared note-selection RNG")
+    args = parser.parse_args(argv)
+
+    def ready(port):
+        # quiz_load --spawn 读取这一行获得端口
+        print(f"listening on {args.host}:{port}", flush=True)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.seed, ready))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""练习会话的状态机（不依赖 pygame）：出题、判分、计分和烟花触发。
+
+游戏的练习界面（run_clef）和多会话测验服务器（quiz_server）共用 QuizSession，视奏模式（run_sight_reading）
+使用 SightReadingSession；界面只负责显示、声音和输入。
+每个谱号的题目（音符名、答案表）由所有会话共享，单个会话只保存分数、当前题目和计时等少量状态。
+"""
+import bisect
+import random
+from collections import namedtuple
+
+NOTE_LETTERS = ['C', 'D', 'E', 'F', 'G', 'A', 'B']   # 按键 1-7 依次对应
+
+# 各谱号的 (第1线上的音, 最低音, 最高音)
+CLEF_RANGES = {
+    'treble': ('E4', 'C4', 'A5'),
+    'bass': ('G2', 'E2', 'C4'),
+    'alto': ('F3', 'D3', 'B4'),
+    'tenor': ('D3', 'B2', 'G4'),
+}
+
+# 每答对这么多题放一次烟花
+FIREWORK_EVERY = 10
+
+# 视奏时间轴上音符的状态
+SIGHT_PENDING, SIGHT_TARGET, SIGHT_CORRECT, SIGHT_WRONG = range(4)
+SIGHT_GAPS = (1, 1, 1, 1.5, 2)   # 相邻音符的间距是基本间距的这些倍数之一
+SIGHT_CHUNK = 32                 # 时间轴每次续写的音符数
+
+def diatonic_step(note):
+    """自然音级序号：C0 = 0，每升高一个音名加 1"""
+    return int(note[-1]) * 7 + NOTE_LETTERS.index(note[0])
+
+def step_to_note(step):
+    return f"{NOTE_LETTERS[step % 7]}{step // 7}"
+
+class NotePool:
+    """一个谱号的全部题目：从低到高的音符名，以及每个音符对应的正确按键（0=C ... 6=B）"""
+    __slots__ = ('name', 'notes', 'answers', 'index')
+
+    def __init__(self, name, low, high):
+        self.name = name
+        self.notes = tuple(step_to_note(step) for step in range(diatonic_step(low), diatonic_step(high) + 1))
+        self.answers = bytes(NOTE_LETTERS.index(note[0]) for note in self.notes)
+        self.index = {note: i for i, note in enumerate(self.notes)}
+
+def firework_due(score, last_firework_score):
+    """分数刚到 FIREWORK_EVERY 的倍数且还没为这个分数放过烟花"""
+    return score % FIREWORK_EVERY == 0 and score > last_firework_score
+
+def clef_pools():
+    return {name: NotePool(name, low, high) for name, (_, low, high) in CLEF_RANGES.items()}
+
+# 一次作答的结果；note 和 next_note 为题目在 NotePool 中的下标
+Answer = namedtuple('Answer', 'note guess correct response_time score fireworks next_note')
+
+class QuizSession:
+    """scheduler 需提供 next() 和 record(note, correct, response_time)（见 note_scheduler.NoteScheduler）。
+    时间由调用方传入（秒，单调时钟），状态机本身不读时钟，便于回放和测试。
+    """
+    __slots__ = ('pool', 'scheduler', 'score', 'attempts', 'current', 'shown_at', 'last_firework_score')
+
+    def __init__(self, pool, scheduler, now):
+        self.pool = pool
+        self.scheduler = scheduler
+        self.score = 0
+        self.attempts = 0
+        self.current = pool.index[scheduler.next()]
+        self.shown_at = now
+        self.last_firework_score = 0   # 上次触发烟花的分数
+
+    @property
+    def note(self):
+        return self.pool.notes[self.current]
+
+    def answer(self, guess, now):
+        """guess 为 0-6（C-B）。答对换下一题，答错留在当前题；两种情况都从现在开始重新计时"""
+        answered = self.current
+        correct = guess == self.pool.answers[answered]
+        response_time = now - self.shown_at
+        self.scheduler.record(self.pool.notes[answered], correct, response_time)
+        self.attempts += 1
+        self.shown_at = now
+        fireworks = False
+        if correct:
+            self.score += 1
+            self.current = self.pool.index[self.scheduler.next()]
+            if firework_due(self.score, self.last_firework_score):
+                self.last_firework_score = self.score
+                fireworks = True
+        return Answer(answered, guess, correct, response_time, self.score, fireworks, self.current)
+
+class SightReadingSession:
+    """视奏模式的状态机：音符从右向左滚过宽 width 像素的五线谱，按顺序识读。
+
+    音符排在按横坐标（世界坐标，像素）有序的时间轴上，只在末尾追加；scroll 为五线谱左端对应的世界横坐标，
+    随时间以 speed 像素/秒增加。target 为下一个待答音符的序号，它进入五线谱后才能作答，
+    越过五线谱左端 miss_at 像素处仍未作答即算漏过。与 QuizSession 一样，时间由调用方传入。
+    """
+    __slots__ = ('pool', 'scheduler', 'width', 'speed', 'miss_at', 'spacing', 'rng', 'xs', 'notes', 'states',
+                 'target', 'version', 'scroll', 'score', 'missed', 'attempts', 'shown_at', 'last_firework_score',
+                 'max_visible', '_next_x')
+
+    def __init__(self, pool, scheduler, width, speed, miss_at, spacing, now=0.0, start=None, rng=None):
+        self.pool = pool
+        self.scheduler = scheduler
+        self.width = width
+        self.speed = speed
+        self.miss_at = miss_at
+        self.spacing = spacing
+        self.rng = rng or random
+        self.xs = []
+        self.notes = []              # 音符在 pool 中的下标
+        self.states = bytearray()
+        self.target = 0
+        self.version = 0             # 音符状态每变化一次加 1
+        self.scroll = int(now * speed)
+        self.score = 0
+        self.missed = 0
+        self.attempts = 0
+        self.last_firework_score = 0
+        self.max_visible = 0
+        # 第一个音符默认从五线谱右端进入
+        self._next_x = self.scroll + (width if start is None else start)
+        self.extend_to(self.scroll + width)
+        self.shown_at = self._entered_at(now)
+
+    def extend_to(self, x):
+        """续写时间轴，直到最后一个音符的横坐标大于 x（五线谱上的音符之后总还有下一个）"""
+        while not self.xs or self.xs[-1] <= x:
+            for _ in range(SIGHT_CHUNK):
+                self.xs.append(self._next_x)
+                self.notes.append(self.pool.index[self.scheduler.next()])
+                self.states.append(SIGHT_TARGET if len(self.states) == self.target else SIGHT_PENDING)
+                self._next_x += max(1, round(self.spacing * self.rng.choice(SIGHT_GAPS)))
+
+    def advance(self, now):
+        """滚动到 now 时刻，返回其间漏过的音符（Answer 列表，guess 为 None）"""
+        self.scroll = int(now * self.speed)
+        self.extend_to(self.scroll + self.width)
+        missed = []
+        while self.xs[self.target] - self.scroll < self.miss_at:
+            missed.append(self._resolve(None, now))
+        return missed
+
+    def visible(self):
+        """横坐标落在五线谱内的音符下标区间 [lo, hi)"""
+        lo = bisect.bisect_left(self.xs, self.scroll)
+        hi = bisect.bisect_right(self.xs, self.scroll + self.width, lo)
+        self.max_visible = max(self.max_visible, hi - lo)
+        return lo, hi
+
+    def answer(self, guess, now):
+        """guess 为 0-6（C-B）。目标音符还没进入五线谱时忽略并返回 None；否则无论对错都换到下一个音符"""
+        if self.xs[self.target] - self.scroll > self.width:
+            return None
+        return self._resolve(guess, now)
+
+    def _entered_at(self, now):
+        # 目标音符进入五线谱（或现在，若已进入）的时刻，反应时间从这里算起
+        return max(now, (self.xs[self.target] - self.width) / self.speed)
+
+    def _resolve(self, guess, now):
+        i = self.target
+        note = self.notes[i]
+        correct = guess is not None and guess == self.pool.answers[note]
+        response_time = now - self.shown_at
+        self.scheduler.record(self.pool.notes[note], correct, response_time)
+        self.attempts += 1
+        self.states[i] = SIGHT_CORRECT if correct else SIGHT_WRONG
+        self.target += 1
+        self.states[self.target] = SIGHT_TARGET
+        self.version += 1
+        self.shown_at = self._entered_at(now)
+        fireworks = False
+        if correct:
+            self.score += 1
+            if firework_due(self.score, self.last_firework_score):
+                self.last_firework_score = self.score
+                fireworks = True
+        elif guess is None:
+            self.missed += 1
+        return Answer(note, guess, correct, response_time, self.score, fireworks, self.notes[self.target])
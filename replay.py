@@ -0,0 +1,105 @@
+"""在 headless 模式下回放一次练习的事件日志（见 session_log），用于复现练习过程和性能问题。
+
+出题顺序按日志中的 NOTE_SHOWN 记录，按键按记录的时间换算成帧后注入；默认不限速运行，
+--realtime 时按 60 FPS 的节奏回放。回放时会重新记录一份日志并与原日志的作答结果比较，
+输出 JSON 报告（帧耗时统计、作答统计、是否复现一致）：
+
+    python replay.py ~/.music_note_game/logs/20260101-120000-default-treble.mnglog
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame
+import music_note_game as game
+import session_log
+from benchmark import ScriptedClock, summarize
+
+class ReplayScheduler:
+    """按日志中的顺序出题；记录作答什么也不做"""
+
+    def __init__(self, notes):
+        self._notes = iter(notes)
+        self.last = None
+
+    def next(self, avoid_repeat=True):
+        self.last = next(self._notes, self.last)
+        return self.last
+
+    def record(self, note, correct, response_time=None):
+        pass
+
+def answers(records):
+    return [(r.note, r.key, bool(r.correct)) for r in records if r.type == session_log.ANSWER]
+
+def replay(path, fps=60, realtime=False, tail_seconds=1.0):
+    header, records = session_log.read_log(path)
+    clef = game.CLEFS[header['clef']]
+    shown = [header['notes'][r.note] for r in records if r.type == session_log.NOTE_SHOWN]
+    unknown = sorted(set(shown) - set(clef.note_names))
+    if unknown:
+        raise ValueError(f"notes {unknown} are not part of the current {clef.name} clef")
+
+    # 记录时刻 -> 注入事件的帧；第 f 帧末尾注入的事件在第 f+1 帧处理
+    keys_by_frame = {}
+    for r in records:
+        if r.type == session_log.KEY:
+            keys_by_frame.setdefault(max(1, int(r.time * fps)), []).append(r.key)
+    last_time = records[-1].time if records else 0.0
+    frames = int((last_time + tail_seconds) * fps) + 1
+
+    def script(frame):
+        return [pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode='', scancode=0)
+                for key in keys_by_frame.get(frame, ())]
+
+    game.init(headless=True)
+    pygame.event.clear()
+    game.clock = ScriptedClock(pygame, frames, script, throttle=realtime, fps=fps)
+    fd, check_path = tempfile.mkstemp(suffix='.mnglog')
+    os.close(fd)
+    try:
+        check_log = session_log.EventLog(check_path, header)
+        game.run_clef(clef, scheduler=ReplayScheduler(shown), event_log=check_log)
+        check_log.close()
+        _, replayed = session_log.read_log(check_path)
+    finally:
+        os.remove(check_path)
+    pygame.quit()
+
+    original = answers(records)
+    reproduced = answers(replayed)
+    return {
+        'log': path,
+        'clef': clef.name,
+        'recorded_seconds': last_time,
+        'answers': len(original),
+        'correct': sum(correct for _, _, correct in original),
+        'mean_latency_s': (sum(r.latency for r in records if r.type == session_log.ANSWER) / len(original)
+                           if original else 0.0),
+        'reproduced': original == reproduced,
+        'frames': summarize(game.clock.frame_times),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('log', help="session log file (.mnglog)")
+    parser.add_argument('--realtime', action='store_true', help="replay at the game's 60 FPS pace")
+    parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+    report = replay(args.log, realtime=args.realtime)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0 if report['reproduced'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""练习过程的事件日志（不依赖 pygame）。
+
+记录出题、按键和作答结果（含时间戳和反应时间），写成紧凑的二进制文件：
+    魔数 b'MNGLOG2\\n' | 头部长度 (uint32) | 头部 JSON（谱号、音符表、开始时间等）| 定长记录 ...
+每条记录 20 字节：类型 (uint8)、距开始的秒数 (float64)、音符下标 (uint16)、按键码 (int32)、
+是否答对 (uint8)、反应时间秒数 (float32)。方向键、功能键等的 pygame 键码约为 2^30，所以按键码不能用 int16。
+
+游戏线程只负责打包记录并放入有界队列（满了或字段超出范围就丢弃并计数，绝不阻塞或抛出异常），由后台线程批量写盘。
+"""
+import json
+import queue
+import struct
+import threading
+import time
+from collections import namedtuple
+
+MAGIC = b'MNGLOG2\n'
+RECORD = struct.Struct('<BdHiBf')
+HEADER_LENGTH = struct.Struct('<I')
+
+# 记录类型
+NOTE_SHOWN = 1     # 出现新音符
+KEY = 2            # 任意按键
+ANSWER = 3         # 对 1-7 作答的判定结果
+
+Record = namedtuple('Record', 'type time note key correct latency')
+
+class EventLog:
+    def __init__(self, path, header, max_pending=4096):
+        self.path = path
+        self.header = header
+        self.dropped = 0
+        self.started = time.perf_counter()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._file = open(path, 'wb')
+        payload = json.dumps(header).encode('utf-8')
+        self._file.write(MAGIC + HEADER_LENGTH.pack(len(payload)) + payload)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def log(self, type, note=0, key=-1, correct=False, latency=0.0):
+        try:
+            record = RECORD.pack(type, time.perf_counter() - self.started, note, key, correct, latency)
+            self._queue.put_nowait(record)
+        except (struct.error, queue.Full):
+            self.dropped += 1
+
+    def _write_loop(self):
+        while True:
+            chunk = [self._queue.get()]
+            # 一次取完队列中已有的记录，合并成一次写入
+            while True:
+                try:
+                    chunk.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = chunk[-1] is None
+            self._file.write(b''.join(record for record in chunk if record is not None))
+            if done:
+                return
+
+    def close(self):
+        """写完队列中剩余的记录后关闭文件"""
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+
+def read_log(path):
+    """返回 (头部字典, 记录列表)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a session log")
+    offset = len(MAGIC)
+    (length,) = HEADER_LENGTH.unpack_from(data, offset)
+    offset += HEADER_LENGTH.size
+    header = json.loads(data[offset:offset + length].decode('utf-8'))
+    offset += length
+    # 末尾不完整的记录（例如进程被强制结束）直接忽略
+    end = offset + (len(data) - offset) // RECORD.size * RECORD.size
+    records = [Record(*fields) for fields in RECORD.iter_unpack(data[offset:end])]
+    return header, records
@@ -0,0 +1,258 @@
+"""纯 numpy 的音符合成（不依赖 pygame），供游戏和各种工具脚本共用。
+
+直接运行本文件会执行一个微基准，对比逐音符合成和批量合成的耗时：
+    python tone_synth.py
+"""
+import functools
+import time
+import numpy as np
+
+# 钢琴音色由多个谐波组成（基频 + 泛音）
+# 每个谐波的振幅不同，模拟真实钢琴的频谱
+PIANO_HARMONICS = [
+    (1.0, 1.0),      # 基频，最强
+    (2.0, 0.5),      # 第2谐波
+    (3.0, 0.25),     # 第3谐波
+    (4.0, 0.15),     # 第4谐波
+    (5.0, 0.1),      # 第5谐波
+    (6.0, 0.05),     # 第6谐波
+]
+
+# 可选音色：名称 -> 谐波列表 (倍频, 振幅)
+TIMBRES = {
+    'piano': PIANO_HARMONICS,
+    'sine': [(1.0, 1.0)],
+    'organ': [(1.0, 1.0), (2.0, 0.8), (3.0, 0.6), (4.0, 0.4), (6.0, 0.2), (8.0, 0.1)],
+}
+
+# ADSR 包络（Attack-Decay-Sustain-Release）模拟钢琴击弦特性
+ATTACK_TIME = 0.005   # 5ms 快速起音
+DECAY_TIME = 0.1      # 100ms 衰减
+SUSTAIN_LEVEL = 0.6   # 持续音量 60%
+RELEASE_TIME = 0.3    # 300ms 释放
+
+# 批量合成时每批的音符数，限制 (音符 × 谐波 × 采样) 中间数组的大小
+BATCH_NOTES = 16
+
+@functools.lru_cache(maxsize=16)
+def adsr_envelope(n_samples, sample_rate):
+    """构建 ADSR 包络；同样长度和采样率的包络只计算一次（返回只读数组）。
+
+    音符短于起音 + 衰减 + 释放的总时长（约 0.4 秒，例如旋律中的八分音符）时，三段按比例缩短，没有持续段。
+    """
+    attack_samples = int(ATTACK_TIME * sample_rate)
+    decay_samples = int(DECAY_TIME * sample_rate)
+    release_samples = int(RELEASE_TIME * sample_rate)
+    shaped = attack_samples + decay_samples + release_samples
+    if shaped > n_samples:
+        attack_samples = attack_samples * n_samples // shaped
+        decay_samples = decay_samples * n_samples // shaped
+        release_samples = n_samples - attack_samples - decay_samples
+    sustain_samples = n_samples - attack_samples - decay_samples - release_samples
+    
+    envelope = np.zeros(n_samples)
+    
+    # Attack: 从 0 快速升到 1
+    envelope[:attack_samples] = np.linspace(0, 1, attack_samples)
+    
+    # Decay: 从 1 衰减到 sustain_level
+    envelope[attack_samples:attack_samples+decay_samples] = np.linspace(1, SUSTAIN_LEVEL, decay_samples)
+    
+    # Sustain: 保持在 sustain_level
+    envelope[attack_samples+decay_samples:attack_samples+decay_samples+sustain_samples] = SUSTAIN_LEVEL
+    
+    # Release: 从 sustain_level 衰减到 0
+    envelope[n_samples - release_samples:] = np.linspace(SUSTAIN_LEVEL, 0, release_samples)
+    envelope.flags.writeable = False
+    return envelope
+
+@functools.lru_cache(maxsize=16)
+def time_base(n_samples, sample_rate):
+    t = np.arange(n_samples) / sample_rate
+    t.flags.writeable = False
+    return t
+
+def _to_int16(wave):
+    # 归一化到 -1 到 1，再降低音量到 50% 并转换为16位整数
+    peak = np.max(np.abs(wave), axis=-1, keepdims=True)
+    return (wave / peak * (32767 * 0.5)).astype(np.int16)
+
+def synthesize_tone(frequency, duration=0.8, sample_rate=22050, harmonics=PIANO_HARMONICS, channels=2):
+    """合成单个音符，返回 int16 数组：单声道为 (采样数,)，立体声为 (采样数, 2)"""
+    n_samples = int(duration * sample_rate)
+    t = time_base(n_samples, sample_rate)
+    
+    # 叠加所有谐波
+    wave = np.zeros(n_samples)
+    for harmonic_ratio, amplitude in harmonics:
+        wave += amplitude * np.sin(frequency * harmonic_ratio * 2 * np.pi * t)
+    
+    # 应用包络并转换为16位整数
+    wave = _to_int16(wave * adsr_envelope(n_samples, sample_rate))
+    if channels == 1:
+        return wave
+    
+    # 创建立体声（复制单声道）
+    return np.column_stack((wave, wave))
+
+def _integer_harmonics(theta, ratios, amplitudes):
+    """整数倍频的谐波叠加：用 sin((k+1)θ) = 2cosθ·sin(kθ) - sin((k-1)θ) 递推，
+    每个音符只需计算一次 sin 和 cos，而不是每个谐波各算一次 sin"""
+    weights = np.zeros(ratios.max() + 1)
+    np.add.at(weights, ratios, amplitudes)
+    two_cos = 2 * np.cos(theta)
+    prev = np.zeros_like(theta)
+    cur = np.sin(theta)
+    wave = weights[1] * cur
+    for k in range(2, len(weights)):
+        prev *= -1
+        prev += two_cos * cur
+        prev, cur = cur, prev
+        if weights[k]:
+            wave += weights[k] * cur
+    return wave
+
+def synthesize_tones(frequencies, duration=0.8, sample_rate=22050, harmonics=PIANO_HARMONICS, channels=2):
+    """批量合成多个音符，返回 int16 数组：立体声为 (音符数, 采样数, 2)，单声道为 (音符数, 采样数)。
+
+    每批音符在 (音符 × 谐波 × 采样) 布局上广播计算，包络和时间轴在所有音符间共享；
+    谐波为整数倍频时（如钢琴音色）沿谐波轴递推，省去大部分 sin 计算。
+    结果的每个切片 out[i] 都是连续内存，可直接交给 pygame.sndarray.make_sound。
+    """
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    n_samples = int(duration * sample_rate)
+    t = time_base(n_samples, sample_rate)
+    envelope = adsr_envelope(n_samples, sample_rate)
+    ratios = np.array([ratio for ratio, _ in harmonics])
+    amplitudes = np.array([amplitude for _, amplitude in harmonics])
+    shape = (len(frequencies), n_samples) if channels == 1 else (len(frequencies), n_samples, 2)
+    out = np.empty(shape, dtype=np.int16)
+    integer_ratios = np.all(ratios == np.round(ratios))
+    for start in range(0, len(frequencies), BATCH_NOTES):
+        freqs = frequencies[start:start + BATCH_NOTES]
+        theta = (2 * np.pi * freqs[:, None]) * t          # (音符, 采样)
+        if integer_ratios:
+            wave = _integer_harmonics(theta, ratios.astype(int), amplitudes)
+        else:
+            # (音符, 1, 采样) × (谐波, 1) -> (音符, 谐波, 采样)
+            phase = theta[:, None, :] * ratios[:, None]
+            wave = np.einsum('h,nhs->ns', amplitudes, np.sin(phase, out=phase))
+        wave *= envelope
+        mono = _to_int16(wave)
+        if channels == 1:
+            out[start:start + len(freqs)] = mono
+        else:
+            out[start:start + len(freqs), :, 0] = mono
+            out[start:start + len(freqs), :, 1] = mono
+    return out
+
+# --- 序列渲染 ---
+# 把带起始时间和时长的音符序列按块混合成一条连续的音频流，采样级对齐；
+# 任意时刻只保留当前块和正在发声的音符，长序列的内存占用也是有界的。
+@functools.lru_cache(maxsize=16)
+def harmonic_peak(harmonics):
+    """谐波叠加后波形的峰值（用于归一化，与 synthesize_tone 的音量一致）"""
+    ratios = np.array([ratio for ratio, _ in harmonics])
+    amplitudes = np.array([amplitude for _, amplitude in harmonics])
+    if np.all(ratios == np.round(ratios)):
+        # 整数倍频时波形以基频为周期，取一个周期足够细的采样求峰值
+        theta = np.linspace(0, 2 * np.pi, 8192, endpoint=False)
+        return float(np.max(np.abs(amplitudes @ np.sin(np.outer(ratios, theta)))))
+    return float(np.sum(np.abs(amplitudes)))
+
+def render_sequence(events, sample_rate=22050, harmonics=PIANO_HARMONICS, channels=2, chunk_size=4096, gain=0.5):
+    """把按起始时间排好序的 (起始秒, 时长秒, 频率) 序列渲染成 int16 音频块（生成器）。
+
+    每个音符使用与 synthesize_tone 相同的谐波和 ADSR 包络模型，音量为 gain（和弦等同时发声的
+    音符直接相加，超出范围的采样被截断，需要时调小 gain）。每块 chunk_size 个采样，最后一块
+    截止到最后一个音符结束；单声道块形状为 (采样数,)，立体声为 (采样数, 2)。
+    """
+    harmonics = tuple(harmonics)
+    ratios = np.array([ratio for ratio, _ in harmonics])
+    amplitudes = np.array([amplitude for _, amplitude in harmonics])
+    integer_ratios = np.all(ratios == np.round(ratios))
+    scale = gain * 32767 / harmonic_peak(harmonics)
+    pending = iter(events)
+    upcoming = next(pending, None)
+    active = []          # (起始采样, 采样数, 频率)
+    last_end = 0
+    pos = 0
+    while upcoming is not None or active:
+        end = pos + chunk_size
+        while upcoming is not None and round(upcoming[0] * sample_rate) < end:
+            onset, duration, frequency = upcoming
+            start = round(onset * sample_rate)
+            active.append((start, int(duration * sample_rate), frequency))
+            last_end = max(last_end, start + int(duration * sample_rate))
+            upcoming = next(pending, None)
+        mix = np.zeros(chunk_size)
+        still_active = []
+        for start, n_samples, frequency in active:
+            lo, hi = max(pos, start), min(end, start + n_samples)
+            if lo < hi:
+                theta = (2 * np.pi * frequency / sample_rate) * np.arange(lo - start, hi - start)
+                if integer_ratios:
+                    wave = _integer_harmonics(theta, ratios.astype(int), amplitudes)
+                else:
+                    wave = amplitudes @ np.sin(np.outer(ratios, theta))
+                wave *= adsr_envelope(n_samples, sample_rate)[lo - start:hi - start]
+                mix[lo - pos:hi - pos] += wave
+            if start + n_samples > end:
+                still_active.append((start, n_samples, frequency))
+        active = still_active
+        if upcoming is None and not active:
+            mix = mix[:max(0, last_end - pos)]
+        chunk = np.clip(mix * scale, -32768, 32767).astype(np.int16)
+        yield chunk if channels == 1 else np.column_stack((chunk, chunk))
+        pos = end
+
+# 音符到频率的映射（A4 = 440Hz）
+NOTE_FREQUENCIES = {
+    'C4': 261.63, 'D4': 293.66, 'E4': 329.63, 'F4': 349.23,
+    'G4': 392.00, 'A4': 440.00, 'B4': 493.88,
+    'C5': 523.25, 'D5': 587.33, 'E5': 659.25, 'F5': 698.46,
+    'G5': 783.99, 'A5': 880.00,
+    # 低音谱号音符
+    'E2': 82.41, 'F2': 87.31, 'G2': 98.00, 'A2': 110.00, 'B2': 123.47,
+    'C3': 130.81, 'D3': 146.83, 'E3': 164.81,
+    'F3': 174.61, 'G3': 196.00, 'A3': 220.00, 'B3': 246.94
+}
+
+# 各音名相对 A 的半音数
+NOTE_SEMITONES = {'C': -9, 'D': -7, 'E': -5, 'F': -4, 'G': -2, 'A': 0, 'B': 2}
+
+def note_frequency(note):
+    """音符名（如 'C4'、'F#3'、'Bb5'）转换为十二平均律频率"""
+    if note in NOTE_FREQUENCIES:
+        return NOTE_FREQUENCIES[note]
+    letter, accidental, octave = note[0], note[1:-1], int(note[-1])
+    semitones = NOTE_SEMITONES[letter] + {'': 0, '#': 1, 'b': -1}[accidental] + 12 * (octave - 4)
+    return 440.0 * 2 ** (semitones / 12)
+
+# 钢琴全部 88 个键：A0 ~ C8
+PIANO_NOTES = [f"{name}{octave}"
+               for octave in range(0, 9)
+               for name in ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']][9:9 + 88]
+
+# --- 微基准 ---
+def benchmark(notes=None, repeat=3):
+    """对比逐音符合成与批量合成，返回两者的最佳耗时（秒）"""
+    freqs = [note_frequency(note) for note in (notes or list(NOTE_FREQUENCIES))]
+    # 预热包络/时间轴缓存，只比较合成本身
+    synthesize_tone(freqs[0])
+    per_note = batched = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for f in freqs:
+            synthesize_tone(f)
+        per_note = min(per_note, time.perf_counter() - start)
+        start = time.perf_counter()
+        synthesize_tones(freqs)
+        batched = min(batched, time.perf_counter() - start)
+    return per_note, batched
+
+if __name__ == '__main__':
+    for label, notes in [('game notes', list(NOTE_FREQUENCIES)), ('88 keys', PIANO_NOTES)]:
+        per_note, batched = benchmark(notes)
+        print(f"{label:>10} ({len(notes)}): per-note {per_note * 1000:.1f} ms, "
+              f"batched {batched * 1000:.1f} ms, speedup x{per_note / batched:.2f}")